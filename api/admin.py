@@ -12,7 +12,7 @@ from .models import (
 	Feedback,
 	Order,
 	Support,
-	File, Log, Event,
+	File, Log, Event, EventRefresh,
 )
 from .logic import import_users_data, import_categories_data, import_regions_data
 
@@ -114,8 +114,7 @@ class UserAdmin(admin.ModelAdmin):
 		return obj
 
 	def update_ratings(self, request, queryset):
-		for obj in queryset:
-			obj.update_total_rating()
+		User.update_total_ratings(queryset.values_list('id', flat=True))
 		self.message_user(request, "Рейтинг(и) успешно обновлены!")
 
 	update_ratings.short_description = "Обновить общий рейтинг у выбранных записей"
@@ -155,10 +154,40 @@ class RatingAdmin(admin.ModelAdmin):
 	delete_selected.short_description = "Удалить отмеченные записи"
 
 
+class OrderArchiveFilter(admin.SimpleListFilter):
+	# по умолчанию список показывает только незавершенные заказы
+	title = 'Архив'
+	parameter_name = 'archive'
+
+	def lookups(self, request, model_admin):
+		return (('archived', 'Завершенные'), ('all', 'Все'))
+
+	def queryset(self, request, queryset):
+		if self.value() == 'archived':
+			return queryset.archived()
+		if self.value() == 'all':
+			return queryset
+		return queryset.active()
+
+	def choices(self, changelist):
+		for lookup, title in ((None, 'Незавершенные'), *self.lookup_choices):
+			yield {
+				'selected': self.value() == lookup,
+				'query_string': changelist.get_query_string(remove=[self.parameter_name]) if lookup is None else
+				changelist.get_query_string({self.parameter_name: lookup}),
+				'display': title,
+			}
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
 	list_display = ['title', 'owner', 'date', 'current_status', 'approved_executor']
 	list_display_links = ['title']
+	list_filter = [OrderArchiveFilter, 'status']
+	list_select_related = ['owner', 'executor']
+
+	def get_queryset(self, request):
+		return super().get_queryset(request).prefetch_related('responded_users')
 
 	@admin.display(description='Дата завершения', empty_value='не указана')
 	def date(self, obj):
@@ -191,6 +220,13 @@ class EventAdmin(admin.ModelAdmin):
 	list_per_page = 20
 
 
+@admin.register(EventRefresh)
+class EventRefreshAdmin(admin.ModelAdmin):
+	list_display = ['events_type', 'group', 'month', 'events_count', 'refreshed_at']
+	ordering = ['-month', 'events_type', 'group']
+	list_filter = ['events_type', 'group']
+
+
 admin.site.register(Category, CategoryAdmin)
 # admin.site.register(Outsourcer)
 # admin.site.register(Supplier)
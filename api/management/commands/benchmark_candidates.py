@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef, Q, Case, When, Value, BooleanField
+
+from api.matching import outsourcer_index
+from api.models import Group, Order, User
+
+
+class Command(BaseCommand):
+	help = 'Сравнение подбора кандидатов в исполнители заказа через индекс в памяти и запросом к базе'
+
+	def add_arguments(self, parser):
+		parser.add_argument('order_id', type=int)
+		parser.add_argument('--limit', type=int, default=20)
+		parser.add_argument('--repeat', type=int, default=100)
+
+	def get_queryset(self, category_ids, region_id, owner_id, limit):
+		in_categories = User.categories.through.objects.filter(
+			user_id=OuterRef('pk'), category_id__in=category_ids, category__group=Group.OUTSOURCER.value
+		)
+		in_region = Value(False)
+		if region_id is not None:
+			in_region = Case(
+				When(
+					Q(main_region_id=region_id) |
+					Q(Exists(User.regions.through.objects.filter(user_id=OuterRef('pk'), region_id=region_id))),
+					then=Value(True)
+				),
+				default=Value(False),
+				output_field=BooleanField()
+			)
+		return (
+			User.objects.filter(Exists(in_categories), access__gt=-1)
+			.exclude(pk=owner_id)
+			.annotate(in_region=in_region)
+			.order_by('-in_region', '-total_rating', 'id')
+			.values_list('id', flat=True)[:limit]
+		)
+
+	def handle(self, *args, **options):
+		order = Order.objects.filter(pk=options['order_id']).values_list('owner_id', 'owner__main_region_id').first()
+		if order is None:
+			raise CommandError('Заказ не найден')
+
+		owner_id, region_id = order
+		category_ids = list(
+			Order.categories.through.objects.filter(order_id=options['order_id']).values_list('category_id', flat=True)
+		)
+		limit, repeat = options['limit'], options['repeat']
+
+		started_at = time.perf_counter()
+		outsourcer_index.build()
+		build_elapsed = time.perf_counter() - started_at
+
+		started_at = time.perf_counter()
+		for _ in range(repeat):
+			candidates = outsourcer_index.get_candidates(category_ids, region_id, limit=limit, exclude=[owner_id])
+		index_elapsed = (time.perf_counter() - started_at) / repeat
+
+		queryset = self.get_queryset(category_ids, region_id, owner_id, limit)
+		started_at = time.perf_counter()
+		for _ in range(repeat):
+			user_ids = list(queryset.all())
+		orm_elapsed = (time.perf_counter() - started_at) / repeat
+
+		self.stdout.write(f'Построение индекса: {build_elapsed * 1000:.1f} мс')
+		self.stdout.write(f'Индекс в памяти: {index_elapsed * 1e6:.1f} мкс на запрос')
+		self.stdout.write(f'Запрос к базе: {orm_elapsed * 1e6:.1f} мкс на запрос')
+		if [candidate.user_id for candidate in candidates] == user_ids:
+			self.stdout.write(self.style.SUCCESS('Списки кандидатов совпадают'))
+		else:
+			self.stdout.write(self.style.WARNING('Списки кандидатов различаются'))
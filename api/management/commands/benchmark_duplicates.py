@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import User
+
+
+class Command(BaseCommand):
+	help = 'Замер поиска дубликатов пользователей и проверка использования триграммного индекса в плане запроса'
+
+	def add_arguments(self, parser):
+		parser.add_argument('name', type=str)
+		parser.add_argument('--address', type=str, default=None)
+		parser.add_argument('--region', type=int, default=None)
+		parser.add_argument('--categories', type=int, nargs='*', default=None)
+		parser.add_argument('--repeat', type=int, default=20)
+
+	def handle(self, *args, **options):
+		if connection.vendor != 'postgresql':
+			raise CommandError('Поиск дубликатов доступен только для PostgreSQL')
+
+		with transaction.atomic():
+			User.set_similarity_threshold(User.DUPLICATE_NAME_SIMILARITY)
+			queryset = User.find_duplicates(
+				options['name'],
+				address=options['address'],
+				main_region=options['region'],
+				categories=options['categories'],
+			)
+			plan = queryset.explain(analyze=True)
+
+			started_at = time.perf_counter()
+			for _ in range(options['repeat']):
+				list(queryset.all())
+			elapsed = (time.perf_counter() - started_at) / options['repeat']
+
+		self.stdout.write(plan)
+		self.stdout.write(f'Среднее время запроса: {elapsed * 1000:.2f} мс')
+		if 'user_name_trgm_idx' in plan:
+			self.stdout.write(self.style.SUCCESS('План запроса использует индекс user_name_trgm_idx'))
+		else:
+			self.stdout.write(self.style.WARNING('Индекс user_name_trgm_idx не используется в плане запроса'))
@@ -0,0 +1,66 @@
+import time
+import tracemalloc
+
+from bs4.builder import builder_registry
+from django.core.management.base import BaseCommand, CommandError
+
+from api.parser import load_schema
+
+
+class Command(BaseCommand):
+	help = (
+		'Сравнение скорости и пиковой памяти разбора сохраненных страниц событий: html.parser целиком (как раньше), '
+		'с фильтром по контейнеру событий и то же через lxml, если он установлен'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('events_type', type=int, help='Тип событий, схема schema-{type}.yml')
+		parser.add_argument('pages', nargs='+', help='Сохраненные html страницы ресурса')
+		parser.add_argument('--repeat', type=int, default=5)
+
+	def get_modes(self) -> list:
+		modes = [('html.parser', False), ('html.parser', True)]
+		if builder_registry.lookup('lxml'):
+			modes += [('lxml', False), ('lxml', True)]
+		else:
+			self.stdout.write(self.style.WARNING('lxml не установлен, сравниваются только режимы html.parser'))
+		return modes
+
+	def handle(self, *args, **options):
+		schema = load_schema(f'schema-{options["events_type"]}.yml')
+		if not schema.outputs:
+			raise CommandError('Схема не содержит ресурсов')
+
+		pages = []
+		for page in options['pages']:
+			with open(page, encoding='utf-8') as file:
+				pages.append(file.read())
+
+		def run(parser_name, strain):
+			return [
+				list(output.extract(output.parse(html, parser_name, strain)))
+				for html in pages for output in schema.outputs
+			]
+
+		expected = None
+		for parser_name, strain in self.get_modes():
+			started_at = time.perf_counter()
+			for _ in range(options['repeat']):
+				events = run(parser_name, strain)
+			elapsed = time.perf_counter() - started_at
+
+			tracemalloc.start()
+			run(parser_name, strain)
+			peak = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+
+			if expected is None:
+				expected = events
+			mode = f'{parser_name}{" + SoupStrainer" if strain else ""}'
+			pages_per_second = len(pages) * options['repeat'] / elapsed
+			self.stdout.write(
+				f'{mode:<28} {pages_per_second:8.1f} стр/с, пик памяти {peak / 1024 / 1024:6.2f} МБ, '
+				f'событий {sum(len(page_events) for page_events in events)}'
+			)
+			if events != expected:
+				self.stdout.write(self.style.WARNING(f'{mode}: результат отличается от разбора html.parser'))
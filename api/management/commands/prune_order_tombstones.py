@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import OrderTombstone
+
+
+class Command(BaseCommand):
+	help = 'Удаление отметок об удаленных заказах старше ORDER_TOMBSTONE_DAYS дней'
+
+	def handle(self, *args, **options):
+		deleted = OrderTombstone.prune()
+		self.stdout.write(self.style.SUCCESS(f'Удалено отметок: {deleted}'))
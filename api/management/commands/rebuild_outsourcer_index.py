@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.matching import outsourcer_index
+from api.models import UserRanking
+
+
+class Command(BaseCommand):
+	help = 'Перестройка индекса аутсорсеров в памяти во всех процессах (при необходимости с пересчетом UserRanking)'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--rankings', action='store_true', help='Предварительно пересчитать таблицу UserRanking')
+
+	def handle(self, *args, **options):
+		if options['rankings']:
+			UserRanking.rebuild()
+
+		# новая версия в кэше заставит рабочие процессы перестроить свои копии при следующем запросе
+		outsourcer_index.invalidate()
+		started_at = time.perf_counter()
+		outsourcer_index.build()
+		elapsed = time.perf_counter() - started_at
+
+		users_count, keys_count = outsourcer_index.get_size()
+		self.stdout.write(self.style.SUCCESS(
+			f'Индекс построен за {elapsed * 1000:.1f} мс: {users_count} аутсорсеров, {keys_count} пар категория-регион'
+		))
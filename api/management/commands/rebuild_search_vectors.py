@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.models import User
+from api.utils import unaccent
+
+
+class Command(BaseCommand):
+	help = 'Пересчет поисковых данных пользователей: полнотекстовых векторов и названий/адресов без диакритики'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, **options):
+		batch_size = options['batch_size']
+		user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+		for start in range(0, len(user_ids), batch_size):
+			batch_ids = user_ids[start:start + batch_size]
+			users = list(User.objects.filter(pk__in=batch_ids).only('id', 'name', 'address'))
+			for user in users:
+				user.name_unaccented = unaccent(user.name)
+				user.address_unaccented = unaccent(user.address)
+			User.objects.bulk_update(users, ['name_unaccented', 'address_unaccented'])
+			User.update_search_vectors(batch_ids)
+
+		self.stdout.write(self.style.SUCCESS(f'Поисковые данные обновлены у {len(user_ids)} пользователей'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import User
+
+
+class Command(BaseCommand):
+	help = 'Пересчет денормализованной маски групп пользователей по их категориям'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, **options):
+		batch_size = options['batch_size']
+		user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+		for start in range(0, len(user_ids), batch_size):
+			User.update_groups(user_ids[start:start + batch_size])
+
+		self.stdout.write(self.style.SUCCESS(f'Группы обновлены у {len(user_ids)} пользователей'))
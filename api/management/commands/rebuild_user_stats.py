@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import User, UserStats, RatingSummary
+
+
+class Command(BaseCommand):
+	help = 'Полный пересчет счетчиков активности пользователей (оценки и заказы) и сводных рейтингов'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, **options):
+		batch_size = options['batch_size']
+		user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+		for start in range(0, len(user_ids), batch_size):
+			UserStats.rebuild(user_ids[start:start + batch_size])
+			RatingSummary.rebuild(user_ids[start:start + batch_size])
+
+		self.stdout.write(self.style.SUCCESS(f'Статистика пересчитана для {len(user_ids)} пользователей'))
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Event, EventRefresh
+from api.parser import get_event_sources, refresh_events
+from api.utils import get_date_range
+from logger import log
+
+
+class Command(BaseCommand):
+	help = (
+		'Загрузка событий из внешних источников заранее по типу событий, группе и месяцу и удаление прошедших событий. '
+		'С --loop работает как фоновый процесс'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--months', type=int, default=None,
+			help='Сколько месяцев загружать, начиная с текущего (по умолчанию - период списка событий без month)'
+		)
+		parser.add_argument('--max-age', type=int, default=24, help='Через сколько часов месяц загружается повторно')
+		parser.add_argument('--force', action='store_true', help='Загрузить все месяцы независимо от отметок')
+		parser.add_argument('--loop', action='store_true')
+		parser.add_argument('--interval', type=int, default=3600, help='Пауза между проходами в секундах')
+
+	def handle(self, *args, **options):
+		while True:
+			self.refresh(options['months'], timedelta(hours=options['max_age']), options['force'])
+			if not options['loop']:
+				break
+			time.sleep(options['interval'])
+
+	@staticmethod
+	def get_months(months_count: int = None) -> list:
+		# без months_count - все месяцы диапазона, который events/ отдает без параметра month
+		start_date, end_date = get_date_range()
+		months = [start_date]
+		while True:
+			month = (months[-1] + timedelta(days=32)).replace(day=1)
+			if month > end_date if months_count is None else len(months) >= months_count:
+				return months
+			months.append(month)
+
+	def refresh(self, months_count: int, max_age: timedelta, force: bool = False):
+		today = timezone.localdate()
+		pruned = Event.prune(today)
+
+		months = self.get_months(months_count)
+
+		fresh = set()
+		if not force:
+			fresh = set(
+				EventRefresh.objects.filter(month__in=months, refreshed_at__gte=timezone.now() - max_age)
+				.values_list('events_type', 'group', 'month')
+			)
+
+		loaded = failed = 0
+		for events_type, groups in get_event_sources().items():
+			for group in groups:
+				for month in months:
+					if (events_type, group, month) in fresh:
+						continue
+					try:
+						count = refresh_events(events_type, group, month)
+					except Exception as e:
+						# сбой одного источника не должен останавливать фоновый процесс
+						log.error(f'Events refresh failed for type {events_type}, group {group}, {month:%m.%Y}: {e}')
+						count = None
+					if count is None:
+						failed += 1
+					else:
+						loaded += count
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Загружено событий: {loaded}, удалено прошедших: {pruned}, ошибок загрузки: {failed}'
+		))
@@ -0,0 +1,191 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class Candidate(NamedTuple):
+	user_id: int
+	total_rating: float
+	in_region: bool
+
+
+class OutsourcerIndex:
+	"""
+	Инвертированный индекс аутсорсеров в памяти процесса: (категория, регион) -> список (-рейтинг, id),
+	отсортированный как user_ranking_top_idx. Регион None означает все регионы.
+
+	Строится по таблице UserRanking при первом обращении, изменения отдельных пользователей
+	применяются после фиксации транзакции (сигнал rankings_changed).
+	Каждое изменение получает номер версии и записывается в журнал в кэше: остальные процессы при следующем
+	запросе перечитывают из базы только перечисленных в журнале пользователей и перестраивают индекс целиком,
+	лишь если записи журнала уже вытеснены или изменение затрагивает всех пользователей.
+	Для нескольких рабочих процессов нужен общий кэш (Redis, Memcached и т.п.): с locmem каждый процесс
+	видит только собственные изменения.
+	"""
+	VERSION_KEY = 'outsourcer_index_version'
+	CHANGELOG_KEY = 'outsourcer_index_changes:{}'
+	CHANGELOG_TIMEOUT = 24 * 60 * 60
+	MAX_REPLAY = 500  # после стольких пропущенных изменений дешевле перестроить индекс
+	REBUILD = 'all'  # запись журнала о полной перестройке
+
+	def __init__(self):
+		self._lock = threading.RLock()
+		self._local = threading.local()
+		self._built = False
+		self._version = None
+		self._rankings = {}
+		self._user_entries = {}  # пользователь -> {(категория, регион): запись в списке}
+
+	def build(self):
+		with self._lock:
+			version = self._get_version()
+			self._rankings = {}
+			self._user_entries = {}
+			for row in self._get_rows():
+				self._add(*row)
+			self._version = version
+			self._built = True
+
+	def clear(self):
+		with self._lock:
+			self._built = False
+			self._rankings = {}
+			self._user_entries = {}
+
+	def invalidate(self):
+		# Перестройка при следующем обращении во всех процессах
+		with self._lock:
+			self._built = False
+			self._log_change(self.REBUILD)
+
+	def refresh(self, user_ids):
+		# Замена строк указанных пользователей данными из таблицы без полной перестройки
+		user_ids = set(user_ids)
+		if not user_ids:
+			return
+		with self._lock:
+			if self._built:
+				self._reload(user_ids)
+			previous, version = self._version, self._log_change(sorted(user_ids))
+			# изменения других процессов между версиями будут применены из журнала при следующем запросе
+			if self._built and previous is not None and version == previous + 1:
+				self._version = version
+
+	def schedule(self, user_ids):
+		if user_ids is None:
+			transaction.on_commit(self.invalidate)
+			return
+
+		pending = getattr(self._local, 'user_ids', None)
+		if pending is None:
+			pending = self._local.user_ids = set()
+		pending.update(user_ids)
+		transaction.on_commit(self.flush)
+
+	def flush(self):
+		user_ids = getattr(self._local, 'user_ids', None)
+		if user_ids:
+			self._local.user_ids = set()
+			self.refresh(user_ids)
+
+	def ensure_current(self):
+		if not self._built:
+			self.build()
+			return
+
+		version = cache.get(self.VERSION_KEY)
+		if version == self._version:
+			return
+		with self._lock:
+			if not self._replay(version):
+				self.build()
+
+	def get_candidates(self, category_ids, region_id: int = None, limit: int = 20, exclude=()) -> list:
+		# Сначала аутсорсеры из региона заказчика, затем из остальных регионов, внутри - по убыванию рейтинга
+		self.ensure_current()
+		seen = set(exclude)
+		candidates = []
+		stages = [(None, False)] if region_id is None else [(region_id, True), (None, False)]
+		with self._lock:
+			for stage_region_id, in_region in stages:
+				rankings = [self._rankings.get((category_id, stage_region_id), ()) for category_id in category_ids]
+				for neg_rating, user_id in heapq.merge(*rankings):
+					if user_id in seen:
+						continue
+					seen.add(user_id)
+					candidates.append(Candidate(user_id, -neg_rating, in_region))
+					if len(candidates) >= limit:
+						return candidates
+		return candidates
+
+	def get_size(self) -> tuple:
+		return len(self._user_entries), len(self._rankings)
+
+	def _replay(self, version) -> bool:
+		# Применение журнала изменений после локальной версии, False - нужна полная перестройка
+		if not isinstance(version, int) or self._version is None or not 0 < version - self._version <= self.MAX_REPLAY:
+			return False
+
+		keys = [self.CHANGELOG_KEY.format(number) for number in range(self._version + 1, version + 1)]
+		changes = cache.get_many(keys)
+		if len(changes) < len(keys) or self.REBUILD in changes.values():
+			return False
+
+		self._reload({user_id for user_ids in changes.values() for user_id in user_ids})
+		self._version = version
+		return True
+
+	def _reload(self, user_ids):
+		for user_id in user_ids:
+			self._remove(user_id)
+		for row in self._get_rows(user_ids):
+			self._add(*row)
+
+	def _add(self, category_id, region_id, user_id, total_rating):
+		key = (category_id, region_id)
+		entry = (-total_rating, user_id)
+		insort(self._rankings.setdefault(key, []), entry)
+		self._user_entries.setdefault(user_id, {})[key] = entry
+
+	def _remove(self, user_id):
+		# удаляются ровно те записи, что были добавлены, даже если рейтинг в строках пользователя различался
+		for key, entry in self._user_entries.pop(user_id, {}).items():
+			rankings = self._rankings[key]
+			index = bisect_left(rankings, entry)
+			if index < len(rankings) and rankings[index] == entry:
+				del rankings[index]
+			if not rankings:
+				del self._rankings[key]
+
+	@staticmethod
+	def _get_rows(user_ids=None):
+		from api.models import Group, UserRanking
+
+		rows = UserRanking.objects.filter(category__group=Group.OUTSOURCER.value)
+		if user_ids is not None:
+			rows = rows.filter(user_id__in=user_ids)
+		return rows.values_list('category_id', 'region_id', 'user_id', 'total_rating').iterator(chunk_size=5000)
+
+	def _get_version(self):
+		version = cache.get(self.VERSION_KEY)
+		if version is None:
+			cache.add(self.VERSION_KEY, 0, None)
+			version = cache.get(self.VERSION_KEY)
+		return version
+
+	def _log_change(self, change):
+		try:
+			version = cache.incr(self.VERSION_KEY)
+		except ValueError:
+			# журнал начинается заново: процессы со старой версией перестроят индекс
+			cache.add(self.VERSION_KEY, 0, None)
+			return cache.get(self.VERSION_KEY)
+		cache.set(self.CHANGELOG_KEY.format(version), change, self.CHANGELOG_TIMEOUT)
+		return version
+
+
+outsourcer_index = OutsourcerIndex()
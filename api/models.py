@@ -1,14 +1,27 @@
+import operator
 import os
 import re
+import threading
+from collections import Counter
+from datetime import date, timedelta
 from enum import Enum
+from functools import reduce
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField, TrigramSimilarity, TrigramDistance
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, Avg, F
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Q, F, Count, Sum, OuterRef, Subquery, Value, Exists, Case, When
+from django.db.models.functions import Coalesce, Concat, Cast, NullIf
+from django.dispatch import Signal
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
-from api.utils import user_directory_path, MediaFileStorage
+from api.registry import registry
+from api.utils import user_directory_path, MediaFileStorage, unaccent
 
 
 def phone_regex(value):
@@ -17,6 +30,10 @@ def phone_regex(value):
 		raise ValidationError('Неверный формат телефона')
 
 
+# строки UserRanking пользователей user_ids изменены (None - все строки)
+rankings_changed = Signal()
+
+
 class Group(Enum):
 	DESIGNER = 0, 'Дизайнеры и архитекторы'
 	OUTSOURCER = 1, 'Аутсорсеры'
@@ -45,16 +62,29 @@ class Group(Enum):
 
 	@classmethod
 	def get_labels(cls):
-		if not hasattr(cls, '_values'):
+		if not hasattr(cls, '_labels'):
 			cls._labels = [member.label for member in cls]
 		return cls._labels
 
 	@classmethod
 	def get_label_by_value(cls, value):
-		for member in cls:
-			if member.value == value:
-				return member.label
-		raise ValueError(f"Число {value} не найдено в {cls.__name__} значении")
+		try:
+			return registry.group_labels[value]
+		except KeyError:
+			raise ValueError(f"Число {value} не найдено в {cls.__name__} значении") from None
+
+	@classmethod
+	def to_mask(cls, values) -> int:
+		# Битовая маска групп: бит с номером кода группы
+		mask = 0
+		for value in values:
+			if value is not None:
+				mask |= 1 << int(value)
+		return mask
+
+	@classmethod
+	def from_mask(cls, mask: int) -> list:
+		return [member.value for member in cls if mask & (1 << member.value)]
 
 
 class UserGroup(models.Model):
@@ -92,6 +122,20 @@ class Category(models.Model):
 	def __str__(self):
 		return f'{self.name}'
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# сохраним загруженные значения для отслеживания смены группы
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	def has_changed(self, *field_names) -> bool:
+		loaded_values = getattr(self, '_loaded_values', {})
+		return any(
+			field_name in loaded_values and loaded_values[field_name] != getattr(self, field_name)
+			for field_name in field_names
+		)
+
 
 class Country(models.Model):
 	name = models.CharField('Название страны', max_length=20, unique=True)
@@ -129,6 +173,14 @@ class Region(models.Model):
 		return self.name
 
 
+class UserQuerySet(models.QuerySet):
+	def in_groups(self, groups):
+		# Фильтр по денормализованной маске групп без присоединения категорий
+		return self.alias(
+			groups_match=F('groups_mask').bitand(Group.to_mask(groups))
+		).filter(groups_match__gt=0)
+
+
 class User(models.Model):
 	ACCESS_CHOICES = ((-2, 'Недоступен'), (-1, 'Не подтвержден'), (0, 'Базовый'), (1, 'Расширенный'), (2, 'Премиум'),)
 	SEGMENT_CHOICES = ((0, 'Премиум, Средний+'), (1, 'Средний'), (2, 'Средний-, Эконом'),)
@@ -163,37 +215,183 @@ class User(models.Model):
 		blank=True
 	)
 	total_rating = models.FloatField('Общий рейтинг', default=0, editable=False)
+	groups_mask = models.PositiveSmallIntegerField(
+		'Группы пользователя', default=0, editable=False, help_text='Битовая маска групп по видам деятельности'
+	)
+	search_vector = SearchVectorField('Поисковый вектор', null=True, editable=False)
+	# названия и адреса без диакритики для поиска дубликатов по триграммному индексу
+	name_unaccented = models.CharField(max_length=150, blank=True, editable=False)
+	address_unaccented = models.CharField(max_length=150, blank=True, editable=False)
 	token = models.ForeignKey(
 		Token, verbose_name='Токен', on_delete=models.SET_NULL, null=True, blank=True, related_name='user_token'
 	)
 
+	objects = UserQuerySet.as_manager()
+
+	DENORMALIZED_FIELDS = ('groups_mask', 'search_vector', 'total_rating')
+	SEARCH_FIELDS = ('name', 'username', 'keywords', 'description', 'address', 'site_url')
+	SEARCH_CONFIG = 'russian'
+	DUPLICATE_NAME_SIMILARITY = 0.7
+	DUPLICATE_ADDRESS_DISTANCE = 0.5
+	# индексы полнотекстового и триграммного поиска есть только в PostgreSQL,
+	# поэтому они создаются после миграций (api.signals.create_postgres_indexes), а не в Meta.indexes
+	POSTGRES_INDEXES = [
+		GinIndex(fields=['search_vector'], name='user_search_vector_idx'),
+		GinIndex(fields=['name_unaccented'], opclasses=['gin_trgm_ops'], name='user_name_trgm_idx'),
+		GinIndex(fields=['address_unaccented'], opclasses=['gin_trgm_ops'], name='user_address_trgm_idx'),
+	]
+
 	class Meta:
 		verbose_name = 'Пользователь'
 		verbose_name_plural = 'Пользователи'
 		ordering = ('-created_date',)
+		indexes = [
+			# порядок выдачи списка пользователей и постраничный переход по курсору
+			models.Index(fields=['-total_rating', 'name', 'id'], name='user_rating_order_idx'),
+		]
 
 	def __str__(self):
 		return self.name
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# сохраним загруженные значения для отслеживания смены регионов и доступа
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	def has_changed(self, *field_names) -> bool:
+		# незагруженные поля считаются измененными
+		loaded_values = getattr(self, '_loaded_values', {})
+		return any(
+			field_name not in loaded_values or loaded_values[field_name] != getattr(self, field_name)
+			for field_name in field_names
+		)
+
 	def save(self, *args, **kwargs):
-		is_new = self.pk is None
+		self.name_unaccented = unaccent(self.name)
+		self.address_unaccented = unaccent(self.address)
+
+		if self.access > 0 and self.token_id is None and kwargs.get('update_fields') is None:
+			# токен выдается при сохранении пользователя с расширенным доступом, а не при чтении
+			self.token = self.get_api_token()
+
+		update_fields = kwargs.get('update_fields')
+		if update_fields is not None:
+			# копии без диакритики сохраняются вместе с исходными полями
+			update_fields = set(update_fields)
+			for field_name in ('name', 'address'):
+				if field_name in update_fields:
+					update_fields.add(f'{field_name}_unaccented')
+			kwargs['update_fields'] = update_fields
+
+		if not self._state.adding and not args and kwargs.get('update_fields') is None:
+			# денормализованные поля обновляются только через сигналы и пересчет рейтинга
+			# и не перезаписываются из экземпляра
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.DENORMALIZED_FIELDS
+			]
 		super().save(*args, **kwargs)
 
-		if not is_new:
-			self.total_rating = self.calculate_total_rating()
-			super().save(*args, **kwargs)
-
 	def delete(self, *args, **kwargs):
 		# Удаление прикрепленных файлов при удалении пользователя
 		for file in self.files.all():
 			file.delete()
 		super().delete(*args, **kwargs)
 
+	@property
+	def groups(self):
+		return Group.from_mask(self.groups_mask)
+
+	@classmethod
+	def update_groups(cls, user_ids) -> dict:
+		# Пересчет маски групп по текущим категориям пользователей
+		masks = dict.fromkeys(user_ids, 0)
+		if not masks:
+			return masks
+
+		rows = cls.categories.through.objects.filter(
+			user_id__in=list(masks), category__group__isnull=False
+		).values_list('user_id', 'category__group')
+		for user_id, group in rows:
+			masks[user_id] |= Group.to_mask([group])
+
+		users = [cls(pk=pk, groups_mask=mask) for pk, mask in masks.items()]
+		cls.objects.bulk_update(users, ['groups_mask'], batch_size=500)
+		return masks
+
+	@classmethod
+	def update_search_vectors(cls, user_ids):
+		# Пересчет полнотекстового вектора по полям пользователя и его категориям (только PostgreSQL)
+		if connection.vendor != 'postgresql':
+			return
+
+		categories_text = Category.objects.filter(users=OuterRef('pk')).order_by().values('users').annotate(
+			text=StringAgg(Concat('name', Value(' '), 'keywords'), delimiter=' ')
+		).values('text')
+		cls.objects.filter(pk__in=user_ids).update(
+			search_vector=(
+				SearchVector('name', 'username', 'keywords', weight='A', config=cls.SEARCH_CONFIG) +
+				SearchVector(Subquery(categories_text), weight='B', config=cls.SEARCH_CONFIG) +
+				SearchVector('description', weight='C', config=cls.SEARCH_CONFIG) +
+				SearchVector('address', 'site_url', weight='D', config=cls.SEARCH_CONFIG)
+			)
+		)
+
+	@classmethod
+	def find_duplicates(cls, name: str, address: str = None, main_region=None, categories=None, limit: int = 5):
+		"""
+		Поиск похожих пользователей по триграммному индексу названия (оператор %)
+		с уточнением по расстоянию между адресами (оператор <->). Только PostgreSQL с pg_trgm.
+		Порог сходства названий задается в транзакции вызывающего кода через set_similarity_threshold.
+		"""
+		name = unaccent(name)
+		users = cls.objects.filter(main_region_id=main_region, name_unaccented__trigram_similar=name)
+		if categories:
+			users = users.filter(
+				Exists(cls.categories.through.objects.filter(user=OuterRef('pk'), category__in=categories))
+			)
+
+		users = users.annotate(name_similarity=TrigramSimilarity('name_unaccented', name))
+		ordering = ['-name_similarity']
+		if address:
+			users = users.annotate(
+				address_distance=TrigramDistance('address_unaccented', unaccent(address))
+			).filter(address_distance__lte=cls.DUPLICATE_ADDRESS_DISTANCE)
+			ordering.append('address_distance')
+
+		return users.order_by(*ordering)[:limit]
+
+	@staticmethod
+	def set_similarity_threshold(threshold: float):
+		# значение действует до конца текущей транзакции
+		with connection.cursor() as cursor:
+			cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+
+	def reset_rating_aggregate(self):
+		# суммы в RatingSummary меняются F-выражениями, загруженная ранее строка после этого устарела
+		self._state.fields_cache.pop('rating_summary', None)
+
 	def update_total_rating(self):
+		self.reset_rating_aggregate()
 		self.total_rating = self.calculate_total_rating()
 		if self.segment == "":
 			self.segment = None
-		self.save()
+		self.save(update_fields=['total_rating', 'segment'])
+
+	@classmethod
+	def update_total_ratings(cls, user_ids):
+		# Пересчет общего рейтинга группы пользователей, изменившиеся записываются одним пакетным обновлением
+		changed = []
+		for user in cls.objects.filter(pk__in=user_ids).select_related('rating_summary'):
+			total_rating = user.calculate_total_rating()
+			if total_rating != user.total_rating:
+				user.total_rating = total_rating
+				changed.append(user)
+		if changed:
+			cls.objects.bulk_update(changed, ['total_rating'], batch_size=500)
+			UserRanking.refresh_ratings([user.pk for user in changed])
 
 	@classmethod
 	def format_rating(cls, rates: dict, receiver_id: int = None, author_id: int = None):
@@ -211,25 +409,21 @@ class User(models.Model):
 
 		return formatted_rates
 
-	def calculate_total_rating(self, author: int = None):
-		all_fields = [
-			field.name for field in Rating._meta.fields if
-			isinstance(field, models.PositiveSmallIntegerField)
-		]
-		required_fields = [
-			field.name for field in Rating._meta.fields if
-			isinstance(field, models.PositiveSmallIntegerField) and not field.null
-		]
-		query = Q(receiver=self)
+	def get_rating_averages(self, fields: list, author: int = None) -> dict:
 		if author:
-			query &= Q(author=author)
-		ratings = Rating.objects.filter(query)
+			# оценки автора хранятся в одной строке рейтинга
+			rating = Rating.objects.filter(receiver=self, author=author).values(*fields).first() or {}
+			return {field: float(rating[field]) if rating.get(field) is not None else None for field in fields}
+
+		return self.rating_aggregate.get_averages(fields)
+
+	def calculate_total_rating(self, author: int = None):
 		total_rating = self.total_rating
-		user_groups = self.categories.values_list('group__code', flat=True)
+		user_groups = self.groups
 		if not user_groups:
 			return 0
-		fields = required_fields if Group.OUTSOURCER.value == min(user_groups, default=1) else all_fields
-		average_values = ratings.aggregate(**{f'avg_{field}': Avg(field) for field in fields})
+		fields = Rating.get_criteria(required=Group.OUTSOURCER.value == min(user_groups))
+		average_values = self.get_rating_averages(fields, author)
 		values = [value for value in average_values.values() if value]
 		if values:
 			total_rating = sum(values) / len(values)
@@ -238,28 +432,17 @@ class User(models.Model):
 		return total_rating
 
 	def calculate_avg_ratings(self, author: int = None):
-		query = Q(receiver=self)
-		if author:
-			query &= Q(author=author)
-
-		if self.categories.filter(group=1).exists():  # required fields
-			fields = [
-				field.name for field in Rating._meta.fields
-				if isinstance(field, models.PositiveSmallIntegerField) and not field.null
-			]
+		user_groups = self.groups
+		if Group.OUTSOURCER.value in user_groups:  # required fields
+			fields = Rating.get_criteria(required=True)
 
-		elif self.categories.filter(group=2).exists():
-			fields = [
-				field.name for field in Rating._meta.fields
-				if isinstance(field, models.PositiveSmallIntegerField)
-			]
+		elif Group.SUPPLIER.value in user_groups:
+			fields = Rating.get_criteria()
 
 		else:
 			return None
 
-		avg_rating = Rating.objects.filter(query).aggregate(
-			**{f'{field}_avg': Avg(F(field)) for field in fields}
-		)
+		avg_rating = {f'{field}_avg': value for field, value in self.get_rating_averages(fields, author).items()}
 
 		if not avg_rating:
 			return None
@@ -270,42 +453,86 @@ class User(models.Model):
 
 		return self.format_rating(avg_rating, receiver_id=self.pk, author_id=author)
 
+	@property
+	def rating_aggregate(self):
+		try:
+			return self.rating_summary
+		except RatingSummary.DoesNotExist:
+			# строки нет у пользователей, созданных в обход save: значения считаются без записи при чтении
+			self.rating_summary = RatingSummary.calculate([self.pk])[0]
+			return self.rating_summary
+
+	@classmethod
+	def load_aggregates(cls, users: list):
+		# Счетчики и сводные рейтинги, отсутствующие у выбранных через select_related пользователей,
+		# рассчитываются для всей группы одним набором запросов без записи в таблицы
+		for related_name, model in (('stats', UserStats), ('rating_summary', RatingSummary)):
+			descriptor = getattr(cls, related_name)
+			missing = [
+				user for user in users
+				if descriptor.is_cached(user) and descriptor.related.get_cached_value(user) is None
+			]
+			if missing:
+				rows = {row.pk: row for row in model.calculate([user.pk for user in missing])}
+				for user in missing:
+					setattr(user, related_name, rows[user.pk])
+
+	@property
+	def activity_stats(self):
+		try:
+			return self.stats
+		except UserStats.DoesNotExist:
+			# строки нет у пользователей, созданных в обход save: счетчики считаются без записи при чтении
+			self.stats = UserStats.calculate([self.pk])[0]
+			return self.stats
+
 	@property
 	def voted_users_count(self):
-		return self.voted_users.count()
+		return self.activity_stats.voted_users_count
 
 	@property
 	def placed_orders_count(self):
-		return self.owner_orders.exclude(status=0).count()
+		return self.activity_stats.placed_orders_count
 
 	@property
 	def done_orders_count(self):
-		return self.owner_orders.filter(status__in=[3, 4]).count()
+		return self.activity_stats.done_orders_count
 
 	@property
 	def executor_done_orders_count(self):
-		return self.executor_orders.filter(status=3).count()
+		return self.activity_stats.executor_done_orders_count
 
 	def get_token(self):
+		# Только чтение уже выданного токена (ключ токена является его первичным ключом)
 		if self.access > 0:
-			return self.generate_token()
+			return self.token_id
 		return None
 
 	def generate_token(self):
-		superuser = get_user_model().objects.filter(is_superuser=True).first()
-		token, created = Token.objects.update_or_create(user=superuser)
+		token = self.get_api_token()
+		if token is None:
+			return None
+
 		self.token = token
-		self.save()
+		User.objects.filter(pk=self.pk).update(token=token)
 		return token.key
 
+	@staticmethod
+	def get_api_token():
+		superuser = get_user_model().objects.filter(is_superuser=True).first()
+		if superuser is None:
+			return None
+		token, created = Token.objects.get_or_create(user=superuser)
+		return token
+
 
-class UserManager(models.Manager):
+class UserManager(models.Manager.from_queryset(UserQuerySet)):
 	def __init__(self, group: Group):
 		super().__init__()
 		self.group = group.value
 
 	def get_queryset(self):
-		return super().get_queryset().filter(categories__group=self.group)
+		return super().get_queryset().in_groups([self.group])
 
 
 class Designer(User):
@@ -335,6 +562,66 @@ class Supplier(User):
 	objects = UserManager(Group.SUPPLIER)
 
 
+class TotalRatingUpdater:
+	"""
+	Пересчет общего рейтинга получателей оценок.
+
+	В режиме RATING_UPDATE_MODE = 'sync' рейтинг пересчитывается сразу после каждой оценки.
+	В режиме 'deferred' получатель только помечается, а все помеченные пользователи пересчитываются
+	один раз при фиксации транзакции и сохраняются одним пакетным обновлением.
+	"""
+	_local = threading.local()
+
+	@classmethod
+	def schedule(cls, user: User):
+		if settings.RATING_UPDATE_MODE != 'deferred':
+			user.update_total_rating()
+			return
+
+		cls.get_pending().add(user.pk)
+		# повторные вызовы после первого пересчета ничего не делают;
+		# пользователи из отмененной транзакции будут пересчитаны вместе со следующими
+		transaction.on_commit(cls.flush)
+
+	@classmethod
+	def schedule_many(cls, user_ids):
+		# Пересчет группы получателей одним пакетным обновлением в любом режиме
+		if settings.RATING_UPDATE_MODE != 'deferred':
+			User.update_total_ratings(user_ids)
+			return
+
+		cls.get_pending().update(user_ids)
+		transaction.on_commit(cls.flush)
+
+	@classmethod
+	def get_pending(cls) -> set:
+		pending = getattr(cls._local, 'user_ids', None)
+		if pending is None:
+			pending = cls._local.user_ids = set()
+		return pending
+
+	@classmethod
+	def flush(cls):
+		user_ids = getattr(cls._local, 'user_ids', None)
+		if user_ids:
+			cls._local.user_ids = set()
+			User.update_total_ratings(user_ids)
+
+
+class RatingQuerySet(models.QuerySet):
+	def with_avg_rating(self, required: bool = False):
+		# Средняя оценка по заполненным критериям рассчитывается в запросе (avg_rating_value)
+		criteria = Rating.get_criteria(required=required)
+		total = reduce(operator.add, (Coalesce(field, 0, output_field=models.IntegerField()) for field in criteria))
+		count = reduce(operator.add, (
+			Case(When(**{f'{field}__isnull': False}, then=1), default=0, output_field=models.IntegerField())
+			for field in criteria
+		))
+		return self.annotate(
+			avg_rating_value=Cast(total, models.FloatField()) / NullIf(Cast(count, models.FloatField()), 0.0)
+		)
+
+
 class Rating(models.Model):
 	author = models.ForeignKey(
 		User,
@@ -363,40 +650,238 @@ class Rating(models.Model):
 	location = models.PositiveSmallIntegerField('Удобство расположения', null=True, blank=True)
 	modified_date = models.DateField('Дата последнего обновления', auto_now=True)
 
+	objects = RatingQuerySet.as_manager()
+
 	class Meta:
 		verbose_name = 'Рейтинг'
 		verbose_name_plural = 'Рейтинг'
+		indexes = [
+			models.Index(fields=['receiver', 'author'], name='rating_receiver_author_idx'),
+			# постраничный список авторов оценок получателя по курсору
+			models.Index(fields=['receiver', '-modified_date', '-id'], name='rating_receiver_modified_idx'),
+		]
+		constraints = [
+			models.UniqueConstraint(fields=['author', 'receiver'], name='rating_author_receiver_unique'),
+		]
 
 	def __str__(self):
 		return f'Рейтинг для поставщика {self.receiver}'
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	@staticmethod
+	def get_criteria(required: bool = False) -> list:
+		return registry.rating_required_criteria if required else registry.rating_criteria
+
+	@property
+	def criteria_values(self) -> dict:
+		return {field: getattr(self, field) for field in self.get_criteria()}
+
 	def delete(self, *args, **kwargs):
 		receiver = self.receiver
-		super().delete(*args, **kwargs)
-		receiver.update_total_rating()
+		with transaction.atomic():
+			result = super().delete(*args, **kwargs)
+			receiver.reset_rating_aggregate()
+			TotalRatingUpdater.schedule(receiver)
+		return result
 
 	def save(self, *args, **kwargs):
-		super().save(*args, **kwargs)
-		self.receiver.update_total_rating()
+		loaded_values = getattr(self, '_loaded_values', {})
+		loaded_receiver_id = loaded_values.get('receiver_id')
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			# количество и суммы оценок у получателя (вычитание при удалении выполняется в сигнале)
+			if loaded_receiver_id != self.receiver_id:
+				UserStats.apply(loaded_receiver_id, voted_users_count=-1)
+				UserStats.apply(self.receiver_id, voted_users_count=1)
+				RatingSummary.apply(loaded_receiver_id, old_values=loaded_values)
+				RatingSummary.apply(self.receiver_id, new_values=self.criteria_values)
+			else:
+				RatingSummary.apply(self.receiver_id, old_values=loaded_values, new_values=self.criteria_values)
+
+			# в режиме deferred пересчет привязан к фиксации этой же транзакции и объединяется с соседними
+			self.receiver.reset_rating_aggregate()
+			TotalRatingUpdater.schedule(self.receiver)
+
+		self._loaded_values = {'receiver_id': self.receiver_id, **self.criteria_values}
+
+	@classmethod
+	def upsert(cls, author_id: int, values: dict, receivers: dict) -> list:
+		"""
+		Пакетное создание и обновление оценок автора.
+		values - значения критериев по id получателей, receivers - загруженные получатели по id.
+		Существующие оценки выбираются одним запросом, а счетчики, суммы и общий рейтинг
+		каждого получателя пересчитываются один раз на весь пакет.
+		Если параллельный запрос того же автора успел создать оценку, пакет повторяется с перечитанными оценками.
+		"""
+		try:
+			return cls._upsert(author_id, values, receivers)
+		except IntegrityError:
+			return cls._upsert(author_id, values, receivers)
+
+	@classmethod
+	def get_existing(cls, author_id: int, receiver_ids) -> dict:
+		ratings = cls.objects.filter(author_id=author_id, receiver_id__in=receiver_ids)
+		return {rating.receiver_id: rating for rating in ratings}
+
+	@classmethod
+	def _upsert(cls, author_id: int, values: dict, receivers: dict) -> list:
+		existing = cls.get_existing(author_id, values)
+		required_criteria = cls.get_criteria(required=True)
+		today = timezone.localdate()  # auto_now не применяется в bulk_update
+		ratings, created, updated, changes = [], [], [], []
+		for receiver_id, criteria in values.items():
+			rating = existing.get(receiver_id)
+			if rating is None:
+				missing = [field for field in required_criteria if criteria.get(field) is None]
+				if missing:
+					raise ValidationError({field: 'Обязательное поле.' for field in missing})
+				rating = cls(author_id=author_id, receiver_id=receiver_id, **criteria)
+				old_values = None
+				created.append(rating)
+			else:
+				old_values = rating.criteria_values
+				for field, value in criteria.items():
+					setattr(rating, field, value)
+				rating.modified_date = today
+				updated.append(rating)
+
+			rating.receiver = receivers[receiver_id]
+			changes.append((receiver_id, old_values, rating.criteria_values))
+			ratings.append(rating)
+
+		with transaction.atomic():
+			cls.objects.bulk_create(created)
+			cls.objects.bulk_update(updated, [*cls.get_criteria(), 'modified_date'])
+			UserStats.apply_many([rating.receiver_id for rating in created], voted_users_count=1)
+			RatingSummary.apply_many(changes)
+			TotalRatingUpdater.schedule_many(list(values))
+
+		for rating in ratings:
+			rating._loaded_values = {'receiver_id': rating.receiver_id, **rating.criteria_values}
+		return ratings
 
 	@property
 	def avg_rating(self):
-		if self.receiver.categories.filter(group=1).exists():  # required fields
-			fields = [
-				field.name for field in self._meta.fields
-				if isinstance(field, models.PositiveSmallIntegerField) and not field.null
-			]
-
-		else:
-			fields = [
-				field.name for field in self._meta.fields
-				if isinstance(field, models.PositiveSmallIntegerField)
-			]
+		if 'avg_rating_value' in self.__dict__:  # рассчитано в запросе через with_avg_rating
+			return round(self.avg_rating_value, 1) if self.avg_rating_value is not None else None
 
+		# для аутсорсеров учитываются только обязательные критерии
+		fields = self.get_criteria(required=Group.OUTSOURCER.value in self.receiver.groups)
 		avg_values = [value for value in (getattr(self, field, None) for field in fields) if value is not None]
 		return round(sum(avg_values) / len(avg_values), 1) if avg_values else None
 
 
+class RatingSummary(models.Model):
+	receiver = models.OneToOneField(
+		User, verbose_name='Оцениваемый', on_delete=models.CASCADE, primary_key=True, related_name='rating_summary'
+	)
+	quality_sum = models.PositiveIntegerField(default=0)
+	quality_count = models.PositiveIntegerField(default=0)
+	deadlines_sum = models.PositiveIntegerField(default=0)
+	deadlines_count = models.PositiveIntegerField(default=0)
+	sales_service_quality_sum = models.PositiveIntegerField(default=0)
+	sales_service_quality_count = models.PositiveIntegerField(default=0)
+	service_delivery_quality_sum = models.PositiveIntegerField(default=0)
+	service_delivery_quality_count = models.PositiveIntegerField(default=0)
+	designer_program_quality_sum = models.PositiveIntegerField(default=0)
+	designer_program_quality_count = models.PositiveIntegerField(default=0)
+	location_sum = models.PositiveIntegerField(default=0)
+	location_count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		verbose_name = 'Сводный рейтинг'
+		verbose_name_plural = 'Сводные рейтинги'
+
+	def __str__(self):
+		return f'Сводный рейтинг пользователя {self.receiver_id}'
+
+	def get_averages(self, fields: list) -> dict:
+		averages = {}
+		for field in fields:
+			count = getattr(self, f'{field}_count')
+			averages[field] = getattr(self, f'{field}_sum') / count if count else None
+		return averages
+
+	@classmethod
+	def calculate(cls, receiver_ids=None) -> list:
+		# Суммы и количество оценок по каждому критерию по таблице оценок, без сохранения
+		criteria = Rating.get_criteria()
+		ratings = Rating.objects.all()
+		if receiver_ids is not None:
+			ratings = ratings.filter(receiver_id__in=receiver_ids)
+
+		aggregates = {}
+		annotations = {}
+		for field in criteria:
+			annotations[f'{field}_sum'] = Coalesce(Sum(field), 0)
+			annotations[f'{field}_count'] = Count(field)
+		for row in ratings.order_by().values('receiver_id').annotate(**annotations):
+			aggregates[row.pop('receiver_id')] = row
+
+		if receiver_ids is None:
+			receiver_ids = User.objects.values_list('id', flat=True)
+
+		return [cls(receiver_id=receiver_id, **aggregates.get(receiver_id, {})) for receiver_id in receiver_ids]
+
+	@classmethod
+	def rebuild(cls, receiver_ids=None) -> list:
+		# Полный пересчет сводных рейтингов с записью в таблицу
+		summaries = cls.calculate(receiver_ids)
+		update_fields = [f'{field}_{suffix}' for field in Rating.get_criteria() for suffix in ('sum', 'count')]
+		cls.objects.bulk_create(
+			summaries, batch_size=500, update_conflicts=True, unique_fields=['receiver'], update_fields=update_fields
+		)
+		return summaries
+
+	@staticmethod
+	def get_deltas(old_values: dict = None, new_values: dict = None) -> dict:
+		# Изменение сумм и количества оценок по разнице старых и новых значений оценки
+		old_values = old_values or {}
+		new_values = new_values or {}
+		deltas = {}
+		for field in Rating.get_criteria():
+			old_value, new_value = old_values.get(field), new_values.get(field)
+			sum_delta = (new_value or 0) - (old_value or 0)
+			count_delta = (new_value is not None) - (old_value is not None)
+			if sum_delta:
+				deltas[f'{field}_sum'] = sum_delta
+			if count_delta:
+				deltas[f'{field}_count'] = count_delta
+		return deltas
+
+	@classmethod
+	def apply(cls, receiver_id, old_values: dict = None, new_values: dict = None):
+		# Инкрементальное изменение сумм по разнице старых и новых значений оценки
+		deltas = cls.get_deltas(old_values, new_values)
+		if receiver_id and deltas:
+			cls.objects.filter(pk=receiver_id).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+	@classmethod
+	def apply_many(cls, changes: list):
+		# Изменения (receiver_id, old_values, new_values) для нескольких получателей записываются одним запросом
+		deltas = {}
+		for receiver_id, old_values, new_values in changes:
+			for field, delta in cls.get_deltas(old_values, new_values).items():
+				field_deltas = deltas.setdefault(field, Counter())
+				field_deltas[receiver_id] += delta
+
+		updates = {}
+		receiver_ids = set()
+		for field, field_deltas in deltas.items():
+			whens = [When(pk=receiver_id, then=F(field) + delta) for receiver_id, delta in field_deltas.items() if delta]
+			if whens:
+				updates[field] = Case(*whens, default=F(field), output_field=cls._meta.get_field(field))
+				receiver_ids.update(receiver_id for receiver_id, delta in field_deltas.items() if delta)
+
+		if updates:
+			cls.objects.filter(pk__in=receiver_ids).update(**updates)
+
+
 class Favourite(models.Model):
 	designer = models.ForeignKey(
 		User, verbose_name='Дизайнер/архитектор', on_delete=models.CASCADE, related_name='favourites'
@@ -437,9 +922,20 @@ class Feedback(models.Model):
 		return f'Отзыв о поставщике {self.receiver}'
 
 
+class OrderQuerySet(models.QuerySet):
+	def active(self):
+		# условие совпадает с условием частичных индексов, поэтому выборка не затрагивает архив
+		return self.filter(status__in=Order.ACTIVE_STATUSES)
+
+	def archived(self):
+		return self.filter(status__in=Order.ARCHIVED_STATUSES)
+
+
 class Order(models.Model):
 	STATUS_CHOICES = (
 		(0, 'приостановлен'), (1, 'активный'), (2, 'этап сдачи'), (3, 'завершен'), (4, 'досрочно завершен'),)
+	ACTIVE_STATUSES = (0, 1, 2)
+	ARCHIVED_STATUSES = (3, 4)
 	owner = models.ForeignKey(
 		User,
 		verbose_name='Автор заказа',
@@ -475,10 +971,114 @@ class Order(models.Model):
 	price = models.PositiveIntegerField('Стоимость услуги', null=True, blank=True)
 	expire_date = models.DateField('Дата завершения', null=True, blank=True)
 	status = models.PositiveSmallIntegerField('Статус заказа', choices=STATUS_CHOICES, default=1)
+	modified_at = models.DateTimeField('Дата изменения', auto_now=True)
+	version = models.PositiveIntegerField('Версия', default=0, editable=False)
+
+	objects = OrderQuerySet.as_manager()
 
 	class Meta:
 		verbose_name = 'Заказ на бирже'
 		verbose_name_plural = 'Биржа услуг'
+		indexes = [
+			# лента биржи: частичный индекс только по незавершенным заказам (ACTIVE_STATUSES),
+			# его размер не растет вместе с архивом
+			models.Index(
+				fields=['status', 'expire_date'], condition=Q(status__in=(0, 1, 2)), name='order_active_expire_idx'
+			),
+			# история заказов владельца, включая завершенные
+			models.Index(fields=['owner', 'status'], name='order_owner_status_idx'),
+			# лента изменений orders/?since=
+			models.Index(fields=['modified_at', 'id'], name='order_modified_idx'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	@property
+	def stats_values(self):
+		return self.owner_id, self.executor_id, self.status
+
+	def save(self, *args, **kwargs):
+		loaded_values = getattr(self, '_loaded_values', {})
+		loaded_stats_values = tuple(loaded_values.get(key) for key in ('owner_id', 'executor_id', 'status'))
+		# версия увеличивается в базе, как в touch: устаревший экземпляр не должен уменьшить ее
+		adding = self._state.adding
+		if adding:
+			self.version += 1
+		else:
+			self.version = F('version') + 1
+		if kwargs.get('update_fields') is not None:
+			kwargs['update_fields'] = {*kwargs['update_fields'], 'modified_at', 'version'}
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			if not adding:
+				self.refresh_from_db(fields=['version'])
+			UserStats.apply_order_change(loaded_stats_values if loaded_values else None, self.stats_values)
+
+		self._loaded_values = dict(zip(('owner_id', 'executor_id', 'status'), self.stats_values))
+
+	@classmethod
+	def touch(cls, order_ids):
+		# Отметка изменения заказов без сохранения модели (изменение связей many2many)
+		if order_ids:
+			cls.objects.filter(pk__in=order_ids).update(modified_at=timezone.now(), version=F('version') + 1)
+
+	@classmethod
+	def add_responders(cls, pairs: list):
+		# Пакетный отклик: пары (order_id, user_id) записываются прямо в промежуточную таблицу
+		through = cls.responded_users.through
+		with transaction.atomic():
+			through.objects.bulk_create(
+				[through(order_id=order_id, user_id=user_id) for order_id, user_id in pairs], ignore_conflicts=True
+			)
+			cls.touch({order_id for order_id, _ in pairs})
+
+	@classmethod
+	def remove_responders(cls, pairs: list):
+		if not pairs:
+			return
+		condition = reduce(operator.or_, (Q(order_id=order_id, user_id=user_id) for order_id, user_id in pairs))
+		with transaction.atomic():
+			cls.responded_users.through.objects.filter(condition).delete()
+			cls.touch({order_id for order_id, _ in pairs})
+
+	@classmethod
+	def set_executors(cls, pairs: list):
+		# Назначение исполнителей парами (order_id, user_id или None) одним запросом с пересчетом счетчиков,
+		# снятый исполнитель удаляется из списка претендентов, как при clear_executor
+		executors = dict(pairs)
+		if not executors:
+			return
+		with transaction.atomic():
+			orders = list(
+				cls.objects.select_for_update().filter(pk__in=executors).values_list(
+					'id', 'owner_id', 'executor_id', 'status'
+				)
+			)
+			cls.objects.filter(pk__in=executors).update(
+				executor_id=Case(
+					*(
+						When(pk=order_id, then=Cast(Value(user_id), models.BigIntegerField()))
+						for order_id, user_id in executors.items()
+					),
+					output_field=models.BigIntegerField()
+				),
+				modified_at=timezone.now(),
+				version=F('version') + 1,
+			)
+			for order_id, owner_id, executor_id, order_status in orders:
+				UserStats.apply_order_change(
+					(owner_id, executor_id, order_status), (owner_id, executors[order_id], order_status)
+				)
+			cleared = [
+				Q(order_id=order_id, user_id=executor_id) for order_id, _, executor_id, _ in orders
+				if executor_id is not None and executors[order_id] is None
+			]
+			if cleared:
+				cls.responded_users.through.objects.filter(reduce(operator.or_, cleared)).delete()
 
 	def add_responding_user(self, user_id):
 		try:
@@ -498,6 +1098,201 @@ class Order(models.Model):
 		return self.title
 
 
+class OrderTombstone(models.Model):
+	# Отметка об удаленном заказе для ленты изменений orders/?since=
+	order_id = models.BigIntegerField('ID заказа')
+	modified_at = models.DateTimeField('Дата удаления', default=timezone.now)
+
+	class Meta:
+		verbose_name = 'Удаленный заказ'
+		verbose_name_plural = 'Удаленные заказы'
+		indexes = [
+			models.Index(fields=['modified_at', 'order_id'], name='order_tombstone_modified_idx'),
+		]
+
+	def __str__(self):
+		return f'Заказ {self.order_id}'
+
+	@staticmethod
+	def get_retention_start(now=None):
+		# Отметки хранятся ORDER_TOMBSTONE_DAYS дней, курсоры ленты старше этой даты устаревают
+		return (now or timezone.now()) - timedelta(days=settings.ORDER_TOMBSTONE_DAYS)
+
+	@classmethod
+	def prune(cls, now=None) -> int:
+		deleted, _ = cls.objects.filter(modified_at__lt=cls.get_retention_start(now)).delete()
+		return deleted
+
+
+class UserStats(models.Model):
+	user = models.OneToOneField(
+		User, verbose_name='Пользователь', on_delete=models.CASCADE, primary_key=True, related_name='stats'
+	)
+	voted_users_count = models.PositiveIntegerField('Получено оценок', default=0)
+	placed_orders_count = models.PositiveIntegerField('Размещено заказов', default=0)
+	done_orders_count = models.PositiveIntegerField('Завершено заказов', default=0)
+	executor_done_orders_count = models.PositiveIntegerField('Выполнено заказов в качестве исполнителя', default=0)
+
+	COUNTER_FIELDS = ['voted_users_count', 'placed_orders_count', 'done_orders_count', 'executor_done_orders_count']
+
+	class Meta:
+		verbose_name = 'Статистика пользователя'
+		verbose_name_plural = 'Статистика пользователей'
+
+	def __str__(self):
+		return f'Статистика пользователя {self.user_id}'
+
+	@classmethod
+	def calculate(cls, user_ids=None) -> list:
+		# Счетчики по таблицам рейтингов и заказов, без сохранения
+		def count_by(queryset, field):
+			if user_ids is not None:
+				queryset = queryset.filter(**{f'{field}__in': user_ids})
+			return dict(queryset.order_by().values_list(field).annotate(count=Count('pk')))
+
+		voted = count_by(Rating.objects.all(), 'receiver_id')
+		placed = count_by(Order.objects.exclude(status=0), 'owner_id')
+		done = count_by(Order.objects.filter(status__in=[3, 4]), 'owner_id')
+		executor_done = count_by(Order.objects.filter(status=3), 'executor_id')
+
+		if user_ids is None:
+			user_ids = User.objects.values_list('id', flat=True)
+
+		return [
+			cls(
+				user_id=user_id,
+				voted_users_count=voted.get(user_id, 0),
+				placed_orders_count=placed.get(user_id, 0),
+				done_orders_count=done.get(user_id, 0),
+				executor_done_orders_count=executor_done.get(user_id, 0),
+			) for user_id in user_ids
+		]
+
+	@classmethod
+	def rebuild(cls, user_ids=None) -> list:
+		# Полный пересчет счетчиков с записью в таблицу
+		stats = cls.calculate(user_ids)
+		cls.objects.bulk_create(
+			stats, batch_size=500, update_conflicts=True, unique_fields=['user'], update_fields=cls.COUNTER_FIELDS
+		)
+		return stats
+
+	@classmethod
+	def apply(cls, user_id, **deltas):
+		# Инкрементальное изменение счетчиков, строка создается вместе с пользователем (сигнал user_saved)
+		cls.apply_many([user_id] if user_id else [], **deltas)
+
+	@classmethod
+	def apply_many(cls, user_ids: list, **deltas):
+		deltas = {field: delta for field, delta in deltas.items() if delta}
+		if user_ids and deltas:
+			cls.objects.filter(pk__in=user_ids).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+	@staticmethod
+	def order_counters(values) -> Counter:
+		# Вклад заказа в счетчики владельца и исполнителя
+		counters = Counter()
+		if not values:
+			return counters
+
+		owner_id, executor_id, status = values
+		if owner_id:
+			counters[owner_id, 'placed_orders_count'] += status != 0
+			counters[owner_id, 'done_orders_count'] += status in (3, 4)
+		if executor_id:
+			counters[executor_id, 'executor_done_orders_count'] += status == 3
+		return counters
+
+	@classmethod
+	def apply_order_change(cls, old_values, new_values):
+		counters = cls.order_counters(new_values)
+		counters.subtract(cls.order_counters(old_values))
+
+		deltas = {}
+		for (user_id, field), delta in counters.items():
+			deltas.setdefault(user_id, {})[field] = delta
+		for user_id, user_deltas in deltas.items():
+			cls.apply(user_id, **user_deltas)
+
+
+class UserRanking(models.Model):
+	"""
+	Предрасчитанный рейтинг пользователей в разрезе категорий и регионов для выдачи лучших исполнителей.
+	Для каждой категории пользователя хранится строка без региона (все регионы)
+	и по строке на основной и дополнительные регионы.
+	"""
+	category = models.ForeignKey(Category, verbose_name='Категория', on_delete=models.CASCADE, related_name='+')
+	region = models.ForeignKey(Region, verbose_name='Регион', on_delete=models.CASCADE, related_name='+', null=True)
+	user = models.ForeignKey(User, verbose_name='Пользователь', on_delete=models.CASCADE, related_name='rankings')
+	total_rating = models.FloatField('Общий рейтинг', default=0)
+
+	class Meta:
+		verbose_name = 'Рейтинг в категории'
+		verbose_name_plural = 'Рейтинги в категориях'
+		indexes = [
+			models.Index(fields=['category', 'region', '-total_rating', 'user'], name='user_ranking_top_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.user_id}: {self.total_rating}'
+
+	@classmethod
+	def rebuild(cls, user_ids=None) -> list:
+		# Полная перезапись строк рейтинга пользователей по их категориям и регионам
+		users = User.objects.filter(access__gt=-1)
+		categories = User.categories.through.objects.all()
+		regions = User.regions.through.objects.all()
+		rankings = cls.objects.all()
+		if user_ids is not None:
+			users = users.filter(pk__in=user_ids)
+			categories = categories.filter(user_id__in=user_ids)
+			regions = regions.filter(user_id__in=user_ids)
+			rankings = rankings.filter(user_id__in=user_ids)
+
+		user_regions = {}
+		for user_id, region_id in regions.values_list('user_id', 'region_id'):
+			user_regions.setdefault(user_id, {None}).add(region_id)
+
+		users = {
+			user_id: (total_rating, main_region_id)
+			for user_id, total_rating, main_region_id in users.values_list('id', 'total_rating', 'main_region_id')
+		}
+		rows = []
+		for user_id, category_id in categories.values_list('user_id', 'category_id'):
+			if user_id not in users:
+				continue
+			total_rating, main_region_id = users[user_id]
+			for region_id in user_regions.get(user_id, {None}) | {main_region_id}:
+				rows.append(cls(category_id=category_id, region_id=region_id, user_id=user_id, total_rating=total_rating))
+
+		with transaction.atomic():
+			rankings.delete()
+			cls.objects.bulk_create(rows, batch_size=500)
+		rankings_changed.send(sender=cls, user_ids=user_ids)
+		return rows
+
+	@classmethod
+	def refresh_ratings(cls, user_ids):
+		# Перенос общего рейтинга пользователей в их строки одним запросом
+		total_rating = User.objects.filter(pk=OuterRef('user_id')).values('total_rating')[:1]
+		cls.objects.filter(user_id__in=user_ids).update(total_rating=Subquery(total_rating))
+		rankings_changed.send(sender=cls, user_ids=user_ids)
+
+	@classmethod
+	def set_rating(cls, user_id: int, total_rating: float):
+		cls.objects.filter(user_id=user_id).update(total_rating=total_rating)
+		rankings_changed.send(sender=cls, user_ids=[user_id])
+
+	@classmethod
+	def get_top(cls, category_id: int, region_id: int = None, limit: int = 10) -> list:
+		# id лучших пользователей читаются только из индекса user_ranking_top_idx
+		return list(
+			cls.objects.filter(category_id=category_id, region_id=region_id)
+			.order_by('-total_rating', 'user_id')
+			.values_list('user_id', flat=True)[:limit]
+		)
+
+
 class Support(models.Model):
 	user = models.ForeignKey(User, verbose_name='Автор', on_delete=models.CASCADE, related_name='asked_users')
 	message_id = models.IntegerField('ID сообщения', blank=True)
@@ -576,6 +1371,41 @@ class Event(models.Model):
 		verbose_name = 'Событие'
 		verbose_name_plural = 'События'
 		ordering = ('start_date',)
+		indexes = [
+			models.Index(fields=['type', 'start_date'], name='event_type_start_idx'),
+		]
+		constraints = [
+			models.UniqueConstraint(
+				fields=['source_link'], condition=~Q(source_link=''), name='event_source_link_unique'
+			),
+		]
 
 	def __str__(self):
 		return self.title
+
+	@classmethod
+	def prune(cls, today: date = None) -> int:
+		# Удаление прошедших событий и отметок об обновлении прошедших месяцев
+		today = today or timezone.localdate()
+		EventRefresh.objects.filter(month__lt=today.replace(day=1)).delete()
+		deleted, _ = cls.objects.filter(end_date__lt=today).delete()
+		return deleted
+
+
+class EventRefresh(models.Model):
+	""" Отметка о загрузке событий из внешних источников для типа событий, группы и месяца """
+	events_type = models.PositiveSmallIntegerField('Категория события', choices=Event.TYPE_CHOICES)
+	group = models.PositiveSmallIntegerField('Группа')
+	month = models.DateField('Месяц')
+	events_count = models.PositiveIntegerField('Загружено событий', default=0)
+	refreshed_at = models.DateTimeField('Дата обновления', auto_now=True)
+
+	class Meta:
+		verbose_name = 'Обновление событий'
+		verbose_name_plural = 'Обновления событий'
+		constraints = [
+			models.UniqueConstraint(fields=['events_type', 'group', 'month'], name='event_refresh_unique'),
+		]
+
+	def __str__(self):
+		return f'{self.events_type}/{self.group}: {self.month:%m.%Y}'
@@ -1,29 +1,191 @@
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from glob import glob
 from os import path
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Dict, Iterable, Iterator, NamedTuple
 
 import re
 import yaml
 import requests
-from bs4 import BeautifulSoup
+import soupsieve as sv
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 from datetime import datetime, date
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-from api.models import Event, UserGroup
+from api.models import Event, EventRefresh, UserGroup
+from api.utils import get_date_range
 
 from logger import log
 
+FETCH_TIMEOUT = (5, 30)  # ожидание подключения и ответа, секунды
+FETCH_CONCURRENCY = 4
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+DATE_FORMAT = "%d.%m.%Y"
+DEFAULT_HTML_PARSER = "lxml" if builder_registry.lookup("lxml") else "html.parser"
 
-def load_config(filename: str):
-	current_file_path = path.abspath(__file__)
+_session = None
+_session_lock = threading.Lock()
+_schemas = {}  # путь к файлу схемы -> (время изменения, EventsSchema)
+
+
+class SchemaError(ValueError):
+	pass
+
+
+def parse_date(value: str) -> datetime:
+	return datetime.strptime(value.strip(), DATE_FORMAT)
+
+
+def parse_date_range(value: str) -> dict:
+	# "01.10.2026 - 03.10.2026" или одна дата "01.10.2026"
+	date_values = value.split("-")
+	if len(date_values) == 2:
+		return {"start_date": parse_date(date_values[0]), "end_date": parse_date(date_values[1])}
+	return {"start_date": parse_date(value)}
+
+
+FIELD_CONVERTERS = {
+	"start_date": parse_date_range,
+	"end_date": lambda value: {"end_date": parse_date(value)},
+}
 
-	# Получить путь к директории, содержащей текущий файл
-	current_directory = path.dirname(current_file_path)
 
-	# Сконструировать путь к файлу конфигурации относительно текущей директории
-	config_file_path = path.join(current_directory, filename)
+def get_html_parser() -> str:
+	return settings.EVENTS_HTML_PARSER or DEFAULT_HTML_PARSER
+
+
+def build_strainer(selector: str) -> Optional[SoupStrainer]:
+	"""
+	Фильтр разбора страницы по простому селектору контейнера: тег, один класс и/или id (div.content, #feed).
+	Для составных селекторов возвращает None и страница разбирается целиком.
+	"""
+	match = re.fullmatch(r'([a-zA-Z][\w-]*)?(?:\.([\w-]+))?(?:#([\w-]+))?', selector.strip())
+	if not match or not any(match.groups()):
+		return None
+
+	name, class_name, element_id = match.groups()
+	attrs = {}
+	if class_name:
+		# при разборе с фильтром class приходит строкой со всеми классами элемента
+		attrs["class"] = lambda value: bool(value) and class_name in (value.split() if isinstance(value, str) else value)
+	if element_id:
+		attrs["id"] = element_id
+	return SoupStrainer(name, attrs)
+
+
+def compile_selector(selector: str):
+	try:
+		return sv.compile(selector)
+	except sv.SelectorSyntaxError as e:
+		raise SchemaError(f'Invalid selector "{selector}": {e}') from e
+
+
+class FieldExtractor:
+	""" Значение поля события из карточки по скомпилированному селектору, атрибуту и преобразованию поля """
+
+	def __init__(self, field: dict, base_url: str):
+		self.name = field.get("field")
+		if not self.name:
+			raise SchemaError(f"Field name not found in schema: {field}")
+		# поле без селектора в схеме описано, но не заполняется
+		self.selector = compile_selector(field["selector"]) if field.get("selector") else None
+		self.attribute = field.get("attribute")
+		self.is_link = self.attribute in ("href", "src")
+		self.base_url = base_url
+		self.convert = FIELD_CONVERTERS.get(self.name)
+
+	def extract(self, element) -> dict:
+		if self.selector is None:
+			return {}
+		element = self.selector.select_one(element)
+		if element is None:
+			return {}
+
+		if self.attribute:
+			value = element.get(self.attribute)
+			if value is None:
+				return {}
+			if self.is_link and (not value.startswith("http") or value.startswith("/")):
+				value = self.base_url + value
+		else:
+			value = element.get_text(strip=True)
+
+		return self.convert(value) if self.convert else {self.name: value}
+
+
+class CompiledSchema:
+	""" Схема разбора страниц ресурса (раздел output): селектор карточек событий и извлечение их полей """
+
+	def __init__(self, base_url: str, output: dict):
+		root = output.get("root")
+		if not root:
+			raise SchemaError("Root container not found in schema")
+		self.base_url = base_url
+		# разбирается только контейнер событий, карточки ищутся в нем
+		self.strainer = build_strainer(root)
+		self.items = compile_selector(f'{root} {output.get("children") or ""}'.strip())
+		self.fields = [FieldExtractor(field, base_url) for field in output.get("fields") or []]
+
+	def parse(self, html: str, parser: str = None, strain: bool = True) -> BeautifulSoup:
+		return BeautifulSoup(html, parser or get_html_parser(), parse_only=self.strainer if strain else None)
+
+	def extract(self, soup) -> Iterator[dict]:
+		for element in self.items.select(soup):
+			event_data = {}
+			for field in self.fields:
+				event_data.update(field.extract(element))
+			yield event_data
+
+
+class EventsSchema(NamedTuple):
+	config: List[dict]
+	outputs: List[CompiledSchema]  # в порядке ресурсов config
+
+	@classmethod
+	def compile(cls, config: Optional[List[dict]]):
+		config = config or []
+		if not isinstance(config, list):
+			raise SchemaError("Schema must be a list of resources")
+		return cls(config, [CompiledSchema(resource.get("url", ""), resource.get("output") or {}) for resource in config])
+
+
+def load_schema(filename: str) -> EventsSchema:
+	"""
+	Загрузка и компиляция схемы ресурсов из файла рядом с модулем.
+	Скомпилированная схема переиспользуется, пока не изменится время модификации файла.
+	"""
+	config_file_path = path.join(path.dirname(path.abspath(__file__)), filename)
+	modified_at = os.stat(config_file_path).st_mtime_ns
+	cached = _schemas.get(config_file_path)
+	if cached and cached[0] == modified_at:
+		return cached[1]
 
 	with open(config_file_path, "r") as file:
-		config = yaml.safe_load(file)
-	return config
+		schema = EventsSchema.compile(yaml.safe_load(file))
+	_schemas[config_file_path] = (modified_at, schema)
+	return schema
+
+
+def load_config(filename: str):
+	return load_schema(filename).config
+
+
+def get_event_sources() -> Dict[int, List[int]]:
+	# Типы событий, для которых есть схема загрузки schema-{type}.yml, и группы пользователей в них
+	sources = {}
+	for config_file_path in sorted(glob(path.join(path.dirname(path.abspath(__file__)), 'schema-*.yml'))):
+		events_type = int(re.search(r'schema-(\d+)\.yml$', config_file_path).group(1))
+		config = load_config(path.basename(config_file_path)) or []
+		sources[events_type] = sorted({
+			group_params["group"] for resource in config for group_params in resource.get("params", [])
+		})
+	return sources
 
 
 def get_params_for_group(config: List[dict], group: int, date_from: str = None, date_to: str = None):
@@ -32,7 +194,8 @@ def get_params_for_group(config: List[dict], group: int, date_from: str = None,
 	for resource in config:
 		for group_params in resource.get("params", []):
 			if group_params.get("group") == group:
-				param_copy = group_params.copy()
+				# конфигурация общая для всех вызовов, меняем только копию параметров
+				param_copy = copy.deepcopy(group_params)
 				date_to_format = param_copy.get("date_to", {}).get("value")
 				date_from_format = param_copy.get("date_from", {}).get("value")
 				param_copy["date_to"]["value"] = format_date(date_to, date_to_format)
@@ -82,87 +245,120 @@ def build_url(base_url: str, params: dict):
 	return re.sub(r'(?<!:)//+', '/', url)
 
 
-def load_events(events_type: int, group: int, date_from: date = None, date_to: date = None) -> Optional[dict]:
-	config = load_config(f'schema-{events_type}.yml')
-	if not config:
+def get_session() -> requests.Session:
+	# Общая для потоков сессия: пул соединений на каждый хост и повтор запросов с нарастающей паузой
+	global _session
+	with _session_lock:
+		if _session is None:
+			retry = Retry(
+				total=FETCH_RETRIES,
+				backoff_factor=FETCH_BACKOFF,
+				status_forcelist=(429, 500, 502, 503, 504),
+				allowed_methods=("GET",),
+				raise_on_status=False,
+			)
+			adapter = HTTPAdapter(pool_connections=10, pool_maxsize=FETCH_CONCURRENCY, max_retries=retry)
+			_session = requests.Session()
+			_session.mount("http://", adapter)
+			_session.mount("https://", adapter)
+	return _session
+
+
+def fetch_all(urls: Iterable[str], concurrency: int = FETCH_CONCURRENCY, timeout=FETCH_TIMEOUT):
+	"""
+	Параллельная загрузка страниц не более чем в concurrency потоков.
+	Отдает пары (url, ответ) по мере готовности, вместо ответа - исключение requests, если запрос не удался.
+	"""
+	session = get_session()
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		futures = {}
+		for url in urls:
+			log.info(f'Sent request on {url}')
+			futures[executor.submit(session.get, url, timeout=timeout)] = url
+
+		for future in as_completed(futures):
+			try:
+				yield futures[future], future.result()
+			except requests.RequestException as e:
+				yield futures[future], e
+
+
+def load_events(
+		events_type: int, group: int, date_from: date = None, date_to: date = None
+) -> Optional[List[Event]]:
+	schema = load_schema(f'schema-{events_type}.yml')
+	if not schema.config:
 		return
 
-	params = get_params_for_group(config, group, date_from, date_to)
+	# у каждого ресурса свои параметры запросов и схема разбора
+	resources = {}
+	for resource, output in zip(schema.config, schema.outputs):
+		for param in get_params_for_group([resource], group, date_from, date_to):
+			resources[build_url(output.base_url, param)] = output
 
-	for resource in config:
-		base_url = resource.get("url", "")
-		schema = resource.get("output", {})
-
-		for param in params:
-			url = build_url(base_url, param)
-			message = f'Sent request on {url}'
-			log.info(message)
-			response = requests.get(url)
-
-			if response.status_code == 200:
-				message = f'Got response [200 OK]'
-				log.info(message)
-				return parse_events(events_type, group, response.text, base_url, schema)
-
-			else:
-				message = f'Error occurred while sending request on {url}'
-				log.error(message, extra=response.headers)
-
-
-def parse_events(events_type: int, group: int, html: str, base_url: str, schema: dict) -> Optional[List[Event]]:
-	soup = BeautifulSoup(html, 'html.parser')
 	events = []
-	root_container = schema.get("root")
-	if not root_container:
-		log.warning("Root container not found in schema")
-		return
-
-	event_elements = soup.select(root_container + " " + (schema.get("children") or ""))
-	for event_element in event_elements:
-		event_data = {"type": events_type}
-		for field in schema.get("fields"):
-			field_name = field.get("field")
-			selector = field.get("selector")
-			attribute = field.get("attribute")
-
-			if not selector:
-				continue
-
-			element = event_element.select_one(selector)
-			if not element:
-				continue
-
-			if attribute:
-				value = element.get(attribute)
-				if attribute in ["href", "src"] and (not value.startswith("http") or value.startswith("/")):
-					value = base_url + value
-			else:
-				value = element.get_text(strip=True)
-
-			event_data[field_name] = value
+	failed = False
+	for url, response in fetch_all(resources):
+		if isinstance(response, Exception) or response.status_code != 200:
+			message = f'Error occurred while sending request on {url}: {response}'
+			log.error(message, extra=getattr(response, "headers", None))
+			failed = True
+			continue
+
+		log.info(f'Got response [200 OK] from {url}')
+		parsed_events = parse_events(events_type, group, response.text, resources[url])
+		if parsed_events is None:
+			failed = True
+		else:
+			events.extend(parsed_events)
+
+	# при частичной ошибке месяц будет загружен повторно, уже сохраненные события не дублируются
+	return None if failed else events
+
+
+def refresh_events(events_type: int, group: int, month: date) -> Optional[int]:
+	# Загрузка событий месяца с отметкой об обновлении, при ошибке загрузки отметка не ставится
+	start_date, end_date = get_date_range(month)
+	events = load_events(events_type, group, start_date, end_date)
+	if events is None:
+		return None
 
-			if field_name == "start_date":
-				date_values = value.split("-")
-				if len(date_values) == 2:
-					event_data["start_date"] = datetime.strptime(date_values[0].strip(), "%d.%m.%Y")
-					event_data["end_date"] = datetime.strptime(date_values[1].strip(), "%d.%m.%Y")
-				else:
-					event_data["start_date"] = datetime.strptime(value, "%d.%m.%Y")
+	EventRefresh.objects.update_or_create(
+		events_type=events_type, group=group, month=start_date, defaults={'events_count': len(events)}
+	)
+	return len(events)
 
-		try:
-			Event.objects.get(source_link=event_data["source_link"])
-		except Event.DoesNotExist:
-			event = Event(**event_data)
-			events.append(event)
 
-	Event.objects.bulk_create(events)
+def parse_events(events_type: int, group: int, html: str, schema: CompiledSchema) -> Optional[List[Event]]:
+	# Сохранение новых событий страницы постоянным числом запросов, возвращает только добавленные события
 	try:
 		user_group = UserGroup.objects.get(code=group)
-		for event in events:
-			event.group.set([user_group])  # присвоим после создания событий номер группы для связанной таблицы many2many
-
 	except UserGroup.DoesNotExist:
 		log.warning(f"UserGroup with code {group} does not exist")
 		return None
 
+	page_events = {}
+	for event_data in schema.extract(schema.parse(html)):
+		source_link = event_data.get("source_link")
+		if not source_link:
+			log.warning(f"Event without source link skipped: {event_data.get('title')}")
+			continue
+		event_data["type"] = events_type
+		page_events.setdefault(source_link, event_data)
+
+	existing_links = set(Event.objects.filter(source_link__in=page_events).values_list("source_link", flat=True))
+	events = [Event(**event_data) for link, event_data in page_events.items() if link not in existing_links]
+	# одновременная загрузка того же события другим процессом пропускается уникальным индексом
+	Event.objects.bulk_create(events, ignore_conflicts=True)
+
+	# id нужны и для ранее сохраненных событий: событие могло быть загружено для другой группы
+	event_ids = dict(Event.objects.filter(source_link__in=page_events).values_list("source_link", "id"))
+	for event in events:
+		event.pk = event_ids.get(event.source_link)
+
+	through = Event.group.through
+	through.objects.bulk_create(
+		[through(event_id=event_id, usergroup_id=user_group.pk) for event_id in event_ids.values()],
+		ignore_conflicts=True
+	)
 	return events
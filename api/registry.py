@@ -0,0 +1,68 @@
+import hashlib
+import itertools
+import json
+from typing import NamedTuple
+
+from django.db import models
+
+
+class JSONPayload(NamedTuple):
+	body: bytes
+	etag: str
+
+	@classmethod
+	def build(cls, data):
+		# JSON в том же виде, что отдает JSONRenderer, и хэш содержимого в качестве ETag
+		body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+		return cls(body, f'"{hashlib.md5(body).hexdigest()}"')
+
+
+class MetadataRegistry:
+	"""
+	Метаданные моделей, которые не меняются во время работы: критерии рейтинга, названия полей пользователя,
+	подписи групп и готовые ответы API с ними.
+	Заполняется один раз в ApiConfig.ready(), при обращении до этого строится по требованию.
+	"""
+	USER_FIELDS_EXCLUDE = (
+		'id', 'access', 'user_id', 'total_rating', 'business_start_year', 'created_date', 'keywords', 'token',
+		'groups_mask', 'search_vector', 'name_unaccented', 'address_unaccented'
+	)
+
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		self.build()
+		try:
+			return self.__dict__[name]
+		except KeyError:
+			raise AttributeError(name) from None
+
+	def build(self):
+		from api.models import Group, Rating, User
+
+		criteria = [field for field in Rating._meta.fields if isinstance(field, models.PositiveSmallIntegerField)]
+		self.rating_criteria = [field.name for field in criteria]
+		self.rating_required_criteria = [field.name for field in criteria if not field.null]
+		self.rating_optional_criteria = [field.name for field in criteria if field.null]
+		self.rating_criteria_labels = {field.name: str(field.verbose_name) for field in criteria}
+
+		self.group_labels = {member.value: member.label for member in Group}
+
+		private_fields = [field for field in User._meta.private_fields if isinstance(field, models.Field)]
+		user_fields = sorted(
+			itertools.chain(User._meta.concrete_fields, private_fields, User._meta.many_to_many),
+			key=lambda field: field.creation_counter
+		)
+		self.user_field_labels = {
+			field.name: str(field.verbose_name or field.name) for field in user_fields
+			if field.name not in self.USER_FIELDS_EXCLUDE
+		}
+
+		required_labels = {
+			name: label for name, label in self.rating_criteria_labels.items() if name in self.rating_required_criteria
+		}
+		self.rating_questions = JSONPayload.build([required_labels, self.rating_criteria_labels])
+		self.user_field_names = JSONPayload.build(self.user_field_labels)
+
+
+registry = MetadataRegistry()
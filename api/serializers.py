@@ -1,3 +1,5 @@
+from django.db import models
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.relations import PrimaryKeyRelatedField
 
@@ -7,6 +9,24 @@ from .models import (
 from .models import Region, Country
 
 
+class SparseFieldsMixin:
+	"""
+	Выборочный набор полей сериализатора: Serializer(instance, fields=['name', 'phone']).
+	Незапрошенные поля удаляются до сериализации, поэтому их методы и запросы не выполняются.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		requested_fields = kwargs.pop('fields', None)
+		super().__init__(*args, **kwargs)
+		self.requested_fields = set(requested_fields) if requested_fields else None
+		if self.requested_fields is not None:
+			for field_name in set(self.fields) - self.requested_fields:
+				self.fields.pop(field_name)
+
+	def is_requested(self, field_name: str) -> bool:
+		return self.requested_fields is None or field_name in self.requested_fields
+
+
 class UserGroupSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = UserGroup
@@ -42,7 +62,7 @@ class CategorySerializer(serializers.ModelSerializer):
 		fields = ['id', 'name', 'group', 'user_count']
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 	groups = serializers.SerializerMethodField()
 
 	class Meta:
@@ -51,20 +71,42 @@ class UserListSerializer(serializers.ModelSerializer):
 		ordering = ['-total_rating']
 
 	def get_groups(self, obj):
-		return list(obj.categories.values_list('group', flat=True).distinct())
+		return obj.groups
 
 	def to_representation(self, instance):
 		representation = super().to_representation(instance)
-		representation['name'] = instance.name
-		representation['username'] = instance.username or ""
+		if self.is_requested('name'):
+			representation['name'] = instance.name
+		if self.is_requested('username'):
+			representation['username'] = instance.username or ""
 		category = self.context.get('category')
-		if category:
+		if category and self.is_requested('category'):
 			representation['category'] = int(category)
-		representation['total_rating'] = instance.total_rating if instance.total_rating else None
+		if self.is_requested('total_rating'):
+			representation['total_rating'] = instance.total_rating if instance.total_rating else None
 
 		return representation
 
 
+class UserShortSerializer(serializers.ModelSerializer):
+	categories = PrimaryKeyRelatedField(many=True, read_only=True)
+	groups = serializers.SerializerMethodField()
+	username = serializers.SerializerMethodField()
+
+	class Meta:
+		model = User
+		fields = [
+			'id', 'user_id', 'name', 'contact_name', 'username', 'access', 'segment', 'categories', 'groups',
+			'total_rating'
+		]
+
+	def get_groups(self, obj):
+		return obj.groups
+
+	def get_username(self, obj):
+		return obj.username or ""
+
+
 class UserDetailSerializer(UserListSerializer):
 	categories = CategorySerializer(many=True, read_only=True, partial=True)
 	main_region = RegionSerializer(read_only=True, partial=True)
@@ -82,7 +124,7 @@ class UserDetailSerializer(UserListSerializer):
 	class Meta:
 		model = User
 		# fields = '__all__'
-		exclude = ('token',)
+		exclude = ('token', 'groups_mask', 'search_vector', 'name_unaccented', 'address_unaccented')
 
 	def get_detail_rating(self, obj):
 		return obj.calculate_avg_ratings()
@@ -191,13 +233,63 @@ class RatingSerializer(serializers.ModelSerializer):
 		}
 
 
+class RatingValuesSerializer(serializers.ModelSerializer):
+	# Проверка значений критериев оценки без обращения к базе
+
+	class Meta:
+		model = Rating
+		fields = Rating.get_criteria()
+
+
 class FeedbackSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = Feedback
 		fields = '__all__'
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderListSerializer(serializers.ListSerializer):
+	"""
+	Сериализация страницы заказов: владельцы, исполнители, категории и претенденты загружаются
+	для всей страницы фиксированным числом запросов, уже загруженные связи повторно не запрашиваются
+	"""
+
+	def to_representation(self, data):
+		orders = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+		child = self.child
+
+		users_fields = []
+		if child.is_requested('owner_id') or child.is_requested('owner_name'):
+			users_fields.append(Order._meta.get_field('owner'))
+		if child.is_requested('executor_id') or child.is_requested('executor_name'):
+			users_fields.append(Order._meta.get_field('executor'))
+		self.load_users(orders, users_fields)
+
+		lookups = []
+		if child.is_requested('categories'):
+			lookups.append('categories__group')
+		if child.is_requested('responded_users') or child.is_requested('executor_name'):
+			lookups.append('responded_users')
+		prefetch_related_objects(orders, *lookups)
+
+		return [child.to_representation(order) for order in orders]
+
+	@staticmethod
+	def load_users(orders: list, fields: list):
+		# владельцы и исполнители всех заказов страницы одним запросом
+		targets = {}
+		for field in fields:
+			for order in orders:
+				user_id = getattr(order, field.attname)
+				if user_id is not None and not field.is_cached(order):
+					targets.setdefault(user_id, []).append((field, order))
+
+		users = User.objects.in_bulk(targets) if targets else {}
+		for user_id, user_targets in targets.items():
+			for field, order in user_targets:
+				field.set_cached_value(order, users.get(user_id))
+
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 	categories = CategorySerializer(many=True, read_only=True)
 	responded_users = UserListSerializer(many=True, read_only=False, partial=True)
 	executor = PrimaryKeyRelatedField(many=False, queryset=User.objects.all())
@@ -205,6 +297,7 @@ class OrderSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = Order
 		fields = '__all__'
+		list_serializer_class = OrderListSerializer
 
 	def create(self, validated_data):
 		cat_ids = self.initial_data.get('categories')
@@ -224,13 +317,17 @@ class OrderSerializer(serializers.ModelSerializer):
 
 	def to_representation(self, instance):
 		order_data = super().to_representation(instance)
-		order_data['executor_id'] = instance.executor.user_id if instance.executor else None
-		order_data['owner_id'] = instance.owner.user_id if instance.owner else None
-		order_data['owner_name'] = instance.owner.name
-		executor = instance.executor
-
-		if executor and executor not in instance.responded_users.all():
-			order_data['executor_name'] = executor.name
+		if self.is_requested('executor_id'):
+			order_data['executor_id'] = instance.executor.user_id if instance.executor else None
+		if self.is_requested('owner_id'):
+			order_data['owner_id'] = instance.owner.user_id if instance.owner else None
+		if self.is_requested('owner_name'):
+			order_data['owner_name'] = instance.owner.name
+
+		if self.is_requested('executor_name'):
+			executor = instance.executor
+			if executor and executor not in instance.responded_users.all():
+				order_data['executor_name'] = executor.name
 
 		return order_data
 
@@ -272,7 +369,7 @@ class LogSerializer(serializers.ModelSerializer):
 		fields = '__all__'
 
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 	class Meta:
 		model = Event
 		fields = '__all__'
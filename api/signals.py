@@ -0,0 +1,167 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_save, pre_delete, post_delete, post_migrate
+from django.dispatch import receiver
+
+from api.matching import outsourcer_index
+from api.models import (
+	User, Category, Rating, Order, OrderTombstone, UserStats, RatingSummary, UserRanking, TotalRatingUpdater,
+	rankings_changed
+)
+
+
+@receiver(m2m_changed, sender=User.categories.through)
+def user_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+	if reverse and action == 'pre_clear':
+		# при очистке со стороны категории список пользователей после удаления связей уже недоступен
+		instance._cleared_user_ids = list(instance.users.values_list('id', flat=True))
+		return
+
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+
+	if not reverse:
+		instance.groups_mask = User.update_groups([instance.pk])[instance.pk]
+		User.update_search_vectors([instance.pk])
+		UserRanking.rebuild([instance.pk])
+		# от групп пользователя зависят критерии общего рейтинга
+		TotalRatingUpdater.schedule_many([instance.pk])
+		return
+
+	if action == 'post_clear':
+		user_ids = getattr(instance, '_cleared_user_ids', [])
+	else:
+		user_ids = pk_set or []
+	User.update_groups(user_ids)
+	User.update_search_vectors(user_ids)
+	UserRanking.rebuild(user_ids)
+	TotalRatingUpdater.schedule_many(user_ids)
+
+
+@receiver(m2m_changed, sender=User.regions.through)
+def user_regions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+	if reverse and action == 'pre_clear':
+		instance._cleared_user_ids = list(instance.regions_users.values_list('id', flat=True))
+		return
+
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+
+	if not reverse:
+		UserRanking.rebuild([instance.pk])
+	elif action == 'post_clear':
+		UserRanking.rebuild(getattr(instance, '_cleared_user_ids', []))
+	else:
+		UserRanking.rebuild(pk_set or [])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+	if update_fields is None or set(update_fields) & set(User.SEARCH_FIELDS):
+		User.update_search_vectors([instance.pk])
+
+	if created:
+		# строки счетчиков создаются сразу, чтобы инкрементальные изменения не терялись и чтение ничего не записывало
+		UserStats.objects.create(user_id=instance.pk)
+		RatingSummary.objects.create(receiver_id=instance.pk)
+
+	# у нового пользователя еще нет категорий, а значит и строк рейтинга
+	if not created:
+		if instance.has_changed('main_region_id', 'access'):
+			UserRanking.rebuild([instance.pk])
+		elif (update_fields is None or 'total_rating' in update_fields) and instance.has_changed('total_rating'):
+			UserRanking.set_rating(instance.pk, instance.total_rating)
+
+	instance._loaded_values = {field.attname: getattr(instance, field.attname) for field in sender._meta.concrete_fields}
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+	if not created:
+		user_ids = None
+		if instance.has_changed('group_id'):
+			user_ids = list(instance.users.values_list('id', flat=True))
+			User.update_groups(user_ids)
+			# от группы категории зависит состав индекса аутсорсеров
+			rankings_changed.send(sender=UserRanking, user_ids=user_ids)
+		if instance.has_changed('name', 'keywords'):
+			if user_ids is None:
+				user_ids = list(instance.users.values_list('id', flat=True))
+			User.update_search_vectors(user_ids)
+
+	instance._loaded_values = {field.attname: getattr(instance, field.attname) for field in sender._meta.concrete_fields}
+
+
+@receiver(pre_delete, sender=Category)
+def category_pre_delete(sender, instance, **kwargs):
+	instance._deleted_user_ids = list(instance.users.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+	user_ids = getattr(instance, '_deleted_user_ids', [])
+	User.update_groups(user_ids)
+	User.update_search_vectors(user_ids)
+	# строки рейтинга категории удалены каскадно
+	rankings_changed.send(sender=UserRanking, user_ids=user_ids)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+	rankings_changed.send(sender=UserRanking, user_ids=[instance.pk])
+
+
+@receiver(rankings_changed, sender=UserRanking)
+def user_rankings_changed(sender, user_ids, **kwargs):
+	outsourcer_index.schedule(user_ids)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+	UserStats.apply(instance.receiver_id, voted_users_count=-1)
+	RatingSummary.apply(instance.receiver_id, old_values=instance.criteria_values)
+
+
+@receiver(m2m_changed, sender=Order.categories.through)
+@receiver(m2m_changed, sender=Order.responded_users.through)
+def order_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+	if reverse and action == 'pre_clear':
+		# поле связи в промежуточной таблице называется по модели: category или user
+		instance._cleared_order_ids = list(
+			sender.objects.filter(**{instance._meta.model_name: instance}).values_list('order_id', flat=True)
+		)
+		return
+
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+
+	if not reverse:
+		Order.touch([instance.pk])
+	elif action == 'post_clear':
+		Order.touch(getattr(instance, '_cleared_order_ids', []))
+	else:
+		Order.touch(pk_set)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+	UserStats.apply_order_change(instance.stats_values, None)
+	OrderTombstone.objects.create(order_id=instance.pk)
+
+
+@receiver(post_migrate)
+def create_postgres_indexes(sender, using, **kwargs):
+	# GIN индексы поиска пользователей: создаются один раз и только в PostgreSQL
+	connection = connections[using]
+	if sender.label != 'api' or connection.vendor != 'postgresql':
+		return
+
+	with connection.cursor() as cursor:
+		existing = connection.introspection.get_constraints(cursor, User._meta.db_table)
+		cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+		has_trigrams = cursor.fetchone() is not None
+	with connection.schema_editor() as schema_editor:
+		for index in User.POSTGRES_INDEXES:
+			# триграммные индексы требуют расширения pg_trgm
+			if index.name in existing or 'gin_trgm_ops' in index.opclasses and not has_trigrams:
+				continue
+			schema_editor.add_index(User, index)
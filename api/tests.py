@@ -1,10 +1,34 @@
 import datetime
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase, Client
+import requests
+from bs4 import BeautifulSoup
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from django.core.exceptions import ValidationError
 
+from api import parser
+from api.matching import OutsourcerIndex, outsourcer_index
+from api.serializers import UserListSerializer, OrderSerializer
+from api.utils import unaccent, encode_cursor, get_date_range, KeysetPagination
+from api.views import OrderListView
+
 from api.models import (
 	phone_regex,
 	Group,
@@ -14,7 +38,16 @@ from api.models import (
 	User,
 	Designer,
 	Outsourcer,
-	Supplier
+	Supplier,
+	Order,
+	OrderTombstone,
+	Rating,
+	UserStats,
+	RatingSummary,
+	TotalRatingUpdater,
+	UserRanking,
+	Event,
+	EventRefresh
 )
 
 res_data = {
@@ -48,6 +81,47 @@ class FetchUserListTestCase(TestCase):
 		response = self.client.get(self.url)
 		self.assertEqual(response.status_code, 200)
 
+	def test_cursor_pagination(self):
+		for i, rating in enumerate([4.5, 3.0, 4.5, 5.0, 3.0]):
+			User.objects.create(name=f'User {i % 2}', total_rating=rating)
+		expected = [user['id'] for user in self.client.get(self.url).json()]
+
+		ids, cursor = [], ''
+		while cursor is not None:
+			response = self.client.get(self.url, {'cursor': cursor, 'limit': 2})
+			self.assertEqual(response.status_code, 200)
+			ids += [user['id'] for user in response.json()]
+			cursor = response.headers.get('next-cursor')
+		self.assertEqual(ids, expected)
+
+	def test_invalid_cursor(self):
+		response = self.client.get(self.url, {'cursor': 'broken'})
+		self.assertEqual(response.status_code, 400)
+
+		for position in [('x', 'y', 'z'), (None, 'User', 1), (4.5, 'User', [1]), (True, 'User', 1)]:
+			response = self.client.get(self.url, {'cursor': encode_cursor(position)})
+			self.assertEqual(response.status_code, 400, position)
+
+		for limit in ['x', '0', '-1']:
+			response = self.client.get(self.url, {'cursor': '', 'limit': limit})
+			self.assertEqual(response.status_code, 400, limit)
+
+
+class KeysetPaginationTestCase(TestCase):
+	def test_nullable_key(self):
+		owner = User.objects.create(name='Owner')
+		for expire_date in [None, datetime.date(2024, 5, 1), None, datetime.date(2024, 3, 1), datetime.date(2024, 5, 1)]:
+			Order.objects.create(owner=owner, title='Order', expire_date=expire_date)
+		keyset = KeysetPagination('-expire_date', 'id')
+		expected = list(keyset.order(Order.objects.all()).values_list('id', flat=True))
+		self.assertEqual(Order.objects.filter(pk__in=expected[-2:], expire_date__isnull=True).count(), 2)
+
+		ids, cursor = [], ''
+		while cursor is not None:
+			orders, cursor = keyset.paginate(Order.objects.all(), cursor, 2)
+			ids += [order.id for order in orders]
+		self.assertEqual(ids, expected)
+
 
 class FetchUserDetailTestCase(TestCase):
 	def setUp(self):
@@ -79,6 +153,948 @@ class FetchUserDetailTestCase(TestCase):
 			res_data
 		)
 
+
+class SparseFieldsTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.user = User.objects.create(name='Supplier', phone='+7(123)456-78-90')
+		Order.objects.create(owner=self.user, title='Order')
+
+	def test_user_detail_fields(self):
+		url = reverse('user-detail', args=[self.user.pk])
+		with self.assertNumQueries(1):
+			response = self.client.get(url, {'fields': 'name,phone'})
+		self.assertEqual(response.json(), {'name': 'Supplier', 'phone': '+7(123)456-78-90'})
+
+		response = self.client.get(url, {'with_details': 'true'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['placed_orders_count'], 1)
+
+	def test_order_list_fields(self):
+		with self.assertNumQueries(1):
+			response = self.client.get(reverse('order-list'), {'fields': 'id,title'})
+		self.assertEqual(response.json(), [{'id': Order.objects.get().pk, 'title': 'Order'}])
+
+
+class OrderListTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		self.categories = [
+			Category.objects.create(name=f'Категория {i}', group_id=Group.OUTSOURCER.value) for i in range(2)
+		]
+		self.owner = User.objects.create(name='Designer')
+		self.outsourcers = [User.objects.create(name=f'Outsourcer {i}') for i in range(2)]
+
+	def create_orders(self, count):
+		for i in range(count):
+			order = Order.objects.create(owner=self.owner, title=f'Order {i}', executor=self.outsourcers[i % 2])
+			order.categories.set(self.categories)
+			order.responded_users.set(self.outsourcers[:1])
+
+	def get_queryset(self, params):
+		request = Request(APIRequestFactory().get(reverse('order-list'), params))
+		view = OrderListView(request=request, kwargs={}, format_kwarg=None)
+		return view.get_queryset()
+
+	def test_filters_without_duplicates(self):
+		self.create_orders(4)
+		params = {'categories': [category.pk for category in self.categories], 'actual': 'true'}
+		response = self.client.get(reverse('order-list'), params)
+		# у второго и четвертого заказа исполнитель не среди откликнувшихся
+		self.assertEqual(len(response.json()), 2)
+
+		queryset = self.get_queryset(params)
+		self.assertNotIn('DISTINCT', str(queryset.query))
+		self.assertIn('EXISTS', str(queryset.query))
+		self.assertNotIn('DISTINCT', queryset.explain().upper())
+
+	def test_constant_queries(self):
+		params = {'categories': self.categories[0].pk}
+		self.create_orders(2)
+		with CaptureQueriesContext(connection) as few:
+			self.client.get(reverse('order-list'), params)
+		self.create_orders(6)
+		with CaptureQueriesContext(connection) as many:
+			response = self.client.get(reverse('order-list'), params)
+		self.assertEqual(len(response.json()), 8)
+		self.assertEqual(len(few), len(many))
+
+
+class OrderSerializerTestCase(TestCase):
+	def setUp(self):
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		categories = [Category.objects.create(name=f'Категория {i}', group_id=Group.OUTSOURCER.value) for i in range(3)]
+		owners = [User.objects.create(name=f'Designer {i}', user_id=f'{i + 1}') for i in range(5)]
+		outsourcers = [User.objects.create(name=f'Outsourcer {i}') for i in range(5)]
+		for i in range(100):
+			order = Order.objects.create(owner=owners[i % 5], title=f'Order {i}', executor=outsourcers[i % 5])
+			order.categories.set(categories[:i % 3 + 1])
+			order.responded_users.set(outsourcers[:i % 2 + 1])
+
+	def test_page_queries(self):
+		# заказы, владельцы и исполнители, категории, группы категорий, претенденты
+		with self.assertNumQueries(5):
+			data = OrderSerializer(Order.objects.order_by('id'), many=True).data
+		self.assertEqual(len(data), 100)
+		self.assertEqual(data[1]['owner_id'], '2')
+		self.assertEqual(len(data[2]['categories']), 3)
+		self.assertEqual(data[2]['executor_name'], 'Outsourcer 2')
+		self.assertNotIn('executor_name', data[0])
+		self.assertEqual(data[0]['responded_users'][0]['groups'], [])
+
+		with self.assertNumQueries(2):
+			data = OrderSerializer(Order.objects.all(), many=True, fields=['id', 'owner_name']).data
+		self.assertEqual(set(data[0]), {'id', 'owner_name'})
+
+	def test_order_list_queries(self):
+		# владельцы и исполнители присоединяются в основном запросе
+		with self.assertNumQueries(4):
+			response = self.client.get(reverse('order-list'))
+		self.assertEqual(len(response.json()), 100)
+
+
+class OrderArchiveTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.owner = User.objects.create(name='Designer')
+		self.active = Order.objects.create(owner=self.owner, title='Active order')
+		self.archived = [
+			Order.objects.create(owner=self.owner, title=f'Finished order {status}', status=status)
+			for status in Order.ARCHIVED_STATUSES
+		]
+
+	def test_feed_reads_active_orders(self):
+		response = self.client.get(reverse('order-list'), {'actual': 'true'})
+		self.assertEqual([item['id'] for item in response.json()], [self.active.pk])
+		self.assertEqual(list(Order.objects.active()), [self.active])
+		self.assertEqual(set(Order.objects.archived()), set(self.archived))
+
+		constraints = connection.introspection.get_constraints(connection.cursor(), Order._meta.db_table)
+		self.assertIn('order_active_expire_idx', constraints)
+
+	def test_archived_orders_readable(self):
+		response = self.client.get(reverse('order-detail', args=[self.archived[0].pk]))
+		self.assertEqual(response.json()['status'], 3)
+		response = self.client.get(reverse('order-list'), {'owner_id': self.owner.pk})
+		self.assertEqual(len(response.json()), 3)
+
+	def test_admin_shows_active_orders(self):
+		get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+		self.client.login(username='admin', password='password')
+		url = reverse('admin:api_order_changelist')
+		self.assertEqual(self.client.get(url).context['cl'].result_count, 1)
+		self.assertEqual(self.client.get(url, {'archive': 'all'}).context['cl'].result_count, 3)
+
+
+@override_settings(ORDER_CHANGES_SETTLE_SECONDS=0)
+class OrderChangesTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		self.category = Category.objects.create(name='Ремонт', group_id=Group.OUTSOURCER.value)
+		self.owner = User.objects.create(name='Designer')
+		self.outsourcer = User.objects.create(name='Outsourcer')
+		self.orders = []
+		for i in range(3):
+			order = Order.objects.create(owner=self.owner, title=f'Order {i}')
+			order.categories.add(self.category)
+			self.orders.append(order)
+
+	def get_changes(self, since, limit=None):
+		params = {'since': since, 'categories': self.category.pk, 'status': 1, 'actual': 'true'}
+		if limit is not None:
+			params['limit'] = limit
+		response = self.client.get(reverse('order-list'), params)
+		self.assertEqual(response.status_code, 200)
+		return response.json(), response.headers.get('next-cursor')
+
+	def test_changes_since_cursor(self):
+		data, cursor = self.get_changes('')
+		self.assertEqual([item['id'] for item in data], [order.id for order in self.orders])
+
+		data, cursor = self.get_changes(cursor)
+		self.assertEqual(data, [])
+
+		closed, responded, deleted = self.orders
+		closed.status = 3
+		closed.save()
+		responded.add_responding_user(self.outsourcer.pk)
+		deleted_id = deleted.pk
+		deleted.delete()
+		new_order = Order.objects.create(owner=self.owner, title='New order')
+		new_order.categories.add(self.category)
+
+		data, cursor = self.get_changes(cursor)
+		self.assertEqual(data[0], {'id': closed.pk, 'removed': True, 'version': Order.objects.get(pk=closed.pk).version})
+		self.assertEqual(data[1]['id'], responded.pk)
+		self.assertEqual(data[1]['responded_users'][0]['id'], self.outsourcer.pk)
+		self.assertEqual(data[2], {'id': deleted_id, 'removed': True})
+		self.assertEqual(data[3]['id'], new_order.pk)
+		self.assertEqual(data[3]['version'], 2)
+
+		self.assertEqual(self.get_changes(cursor), ([], cursor))
+		self.assertEqual(self.client.get(reverse('order-list'), {'since': 'invalid'}).status_code, 400)
+		self.assertEqual(self.client.get(reverse('order-list'), {'since': '', 'limit': 'x'}).status_code, 400)
+
+	def test_order_leaving_scope_marked_removed(self):
+		data, cursor = self.get_changes('')
+		moved = self.orders[0]
+		moved.categories.remove(self.category)
+		data, cursor = self.get_changes(cursor)
+		self.assertEqual(data, [{'id': moved.pk, 'removed': True, 'version': Order.objects.get(pk=moved.pk).version}])
+
+	def test_stale_instance_save_keeps_version_increasing(self):
+		order = Order.objects.get(pk=self.orders[0].pk)
+		Order.touch([order.pk])
+		Order.touch([order.pk])
+		current = Order.objects.get(pk=order.pk).version
+		order.title = 'Renamed'
+		order.save()
+		self.assertEqual(order.version, current + 1)
+		self.assertEqual(Order.objects.get(pk=order.pk).version, current + 1)
+
+	def test_first_load_pages(self):
+		ids, cursor = [], ''
+		for _ in range(3):
+			data, cursor = self.get_changes(cursor, limit=2)
+			ids += [item['id'] for item in data]
+		self.assertEqual(ids, [order.id for order in self.orders])
+		self.assertIsNotNone(cursor)
+
+		self.orders[0].status = 3
+		self.orders[0].save()
+		data, cursor = self.get_changes(cursor, limit=2)
+		self.assertEqual([item['id'] for item in data], [self.orders[0].id])
+
+	def test_empty_first_page_returns_cursor(self):
+		Order.objects.all().delete()
+		data, cursor = self.get_changes('')
+		self.assertEqual(data, [])
+		order = Order.objects.create(owner=self.owner, title='New order')
+		order.categories.add(self.category)
+		data, cursor = self.get_changes(cursor)
+		self.assertEqual([item['id'] for item in data], [order.id])
+
+	def test_settle_horizon(self):
+		data, cursor = self.get_changes('')
+		self.orders[0].status = 3
+		self.orders[0].save()
+		with override_settings(ORDER_CHANGES_SETTLE_SECONDS=60):
+			self.assertEqual(self.get_changes(cursor), ([], cursor))
+		self.assertEqual(self.get_changes(cursor)[0][0]['id'], self.orders[0].id)
+
+	def test_tombstones_pruned(self):
+		data, cursor = self.get_changes('')
+		deleted_id = self.orders[0].pk
+		self.orders[0].delete()
+		OrderTombstone.objects.create(order_id=0, modified_at=timezone.now() - datetime.timedelta(days=31))
+		call_command('prune_order_tombstones', stdout=StringIO())
+		self.assertEqual(list(OrderTombstone.objects.values_list('order_id', flat=True)), [deleted_id])
+
+		with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=31)):
+			response = self.client.get(reverse('order-list'), {'since': cursor})
+		self.assertEqual(response.status_code, 410)
+
+
+class OrderCommandsTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.owner = User.objects.create(name='Designer')
+		self.outsourcers = [User.objects.create(name=f'Outsourcer {i}') for i in range(3)]
+		self.orders = [Order.objects.create(owner=self.owner, title=f'Order {i}') for i in range(2)]
+
+	def command(self, name, data):
+		return self.client.post(reverse(name), data, content_type='application/json')
+
+	def test_respond_and_withdraw(self):
+		pairs = [
+			{'order_id': order.pk, 'user_id': user.pk} for order in self.orders for user in self.outsourcers[:2]
+		]
+		# проверка заказов и пользователей, транзакция с вставкой и отметкой изменения, состояние заказов
+		with self.assertNumQueries(8):
+			response = self.command('order-respond', pairs)
+		self.assertEqual(response.status_code, 200)
+		data = response.json()
+		self.assertEqual([item['id'] for item in data], [order.pk for order in self.orders])
+		self.assertEqual(sorted(data[0]['responded_users']), [user.pk for user in self.outsourcers[:2]])
+		self.assertEqual(data[0]['version'], 2)
+
+		# повторный отклик не создает дубликатов
+		self.command('order-respond', pairs[0])
+		self.assertEqual(self.orders[0].responded_users.count(), 2)
+
+		response = self.command('order-withdraw', [pairs[0], pairs[3]])
+		self.assertEqual(response.json()[0]['responded_users'], [self.outsourcers[1].pk])
+		self.assertEqual(response.json()[1]['responded_users'], [self.outsourcers[0].pk])
+
+	def test_select_executor(self):
+		order = self.orders[0]
+		order.status = 3
+		order.save()
+		UserStats.rebuild([user.pk for user in self.outsourcers])
+
+		response = self.command('order-select-executor', {'order_id': order.pk, 'user_id': self.outsourcers[2].pk})
+		self.assertEqual(response.json()[0]['executor'], self.outsourcers[2].pk)
+		self.assertEqual(self.outsourcers[2].executor_done_orders_count, 1)
+
+		order.add_responding_user(self.outsourcers[2].pk)
+		response = self.command('order-select-executor', {'order_id': order.pk, 'user_id': None})
+		self.assertIsNone(response.json()[0]['executor'])
+		self.assertNotIn(self.outsourcers[2].pk, response.json()[0]['responded_users'])
+		self.assertEqual(UserStats.objects.get(pk=self.outsourcers[2].pk).executor_done_orders_count, 0)
+
+	def test_invalid_commands(self):
+		self.orders[1].status = 0
+		self.orders[1].save()
+		response = self.command('order-respond', {'order_id': self.orders[1].pk, 'user_id': self.outsourcers[0].pk})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.json()['order_id'], [self.orders[1].pk])
+		self.assertEqual(self.command('order-respond', {'order_id': self.orders[0].pk}).status_code, 400)
+		self.assertEqual(self.command('order-withdraw', [{'order_id': 'x', 'user_id': 1}]).status_code, 400)
+
+
+class UserTokenTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+		self.user = User.objects.create(name='Designer')
+		User.objects.filter(pk=self.user.pk).update(access=1)
+
+	def test_get_does_not_write(self):
+		url = reverse('user-detail', args=[self.user.pk])
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.headers['token'], 'None')
+		self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries))
+
+		# строки счетчиков создаются вместе с пользователем, без них значения считаются при чтении без записи
+		self.assertTrue(UserStats.objects.filter(pk=self.user.pk).exists())
+		self.assertTrue(RatingSummary.objects.filter(pk=self.user.pk).exists())
+		UserStats.objects.all().delete()
+		RatingSummary.objects.all().delete()
+		Rating.objects.create(
+			author=User.objects.create(name='Author'), receiver=self.user, deadlines=5, sales_service_quality=4
+		)
+		requests = [
+			(url, {'with_details': 'true'}),
+			(reverse('user-batch'), {'id': self.user.pk, 'with_details': 'true'}),
+		]
+		for request_url, params in requests:
+			with CaptureQueriesContext(connection) as queries:
+				response = self.client.get(request_url, params)
+			self.assertEqual(response.status_code, 200)
+			self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries), request_url)
+		self.assertFalse(UserStats.objects.filter(pk=self.user.pk).exists())
+		self.assertFalse(RatingSummary.objects.filter(pk=self.user.pk).exists())
+
+	def test_issue_token(self):
+		response = self.client.post(reverse('user-token', args=[self.user.pk]))
+		self.assertEqual(response.status_code, 200)
+		token = response.json()['token']
+
+		response = self.client.get(reverse('user-detail', args=[self.user.pk]))
+		self.assertEqual(response.headers['token'], token)
+
+
+class UserBatchTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.category = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value)
+		self.region = Region.objects.create(name='Test Region', country=None, place_id=1, osm_id=1)
+
+	def create_users(self, count):
+		users = []
+		for i in range(count):
+			user = User.objects.create(name=f'Supplier {i}', user_id=f'{i + 1}', main_region=self.region)
+			user.categories.add(self.category)
+			user.regions.add(self.region)
+			users.append(user)
+		return users
+
+	def fetch(self, users, **params):
+		return self.client.get(reverse('user-batch'), {'id': [user.pk for user in users], **params})
+
+	def test_short_cards(self):
+		users = self.create_users(2)
+		response = self.client.get(reverse('user-batch'), {'id': users[0].pk, 'user_id': users[1].user_id})
+		self.assertEqual(response.status_code, 200)
+		data = sorted(response.json(), key=lambda item: item['id'])
+		self.assertEqual([item['id'] for item in data], [user.pk for user in users])
+		self.assertEqual(data[0]['categories'], [self.category.pk])
+		self.assertEqual(data[0]['groups'], [Group.SUPPLIER.value])
+
+	def test_detailed_cards_constant_queries(self):
+		users = self.create_users(8)
+		UserStats.objects.all().delete()
+		RatingSummary.objects.all().delete()
+		with CaptureQueriesContext(connection) as few:
+			self.fetch(users[:2], with_details='true')
+		UserStats.objects.all().delete()
+		RatingSummary.objects.all().delete()
+		with CaptureQueriesContext(connection) as many:
+			response = self.fetch(users, with_details='true')
+		self.assertEqual(len(response.json()), 8)
+		self.assertEqual(len(few), len(many))
+
+	def test_invalid_request(self):
+		self.assertEqual(self.client.get(reverse('user-batch'), {'id': 'abc'}).status_code, 400)
+		self.assertEqual(self.client.get(reverse('user-batch')).json(), [])
+
+
+class UserRankingTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.category = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value)
+		self.city = Region.objects.create(name='City', country=None, place_id=1, osm_id=1)
+		self.other_city = Region.objects.create(name='Other City', country=None, place_id=2, osm_id=2)
+		self.author = User.objects.create(name='Designer')
+		self.suppliers = []
+		for i, region in enumerate([self.city, self.other_city, None]):
+			supplier = User.objects.create(name=f'Supplier {i}', main_region=region)
+			supplier.categories.add(self.category)
+			self.suppliers.append(supplier)
+
+	def rate(self, receiver, value):
+		return Rating.objects.create(author=self.author, receiver=receiver, deadlines=value, sales_service_quality=value)
+
+	def assert_consistent(self):
+		rows = set(UserRanking.objects.values_list('category_id', 'region_id', 'user_id', 'total_rating'))
+		UserRanking.rebuild()
+		self.assertEqual(rows, set(UserRanking.objects.values_list('category_id', 'region_id', 'user_id', 'total_rating')))
+
+	def top(self, **params):
+		response = self.client.get(reverse('user-top'), {'category': self.category.pk, **params})
+		return [item['id'] for item in response.json()]
+
+	def test_incremental_updates(self):
+		first, second, third = self.suppliers
+		self.rate(second, 5)
+		self.rate(first, 3)
+		self.assert_consistent()
+		self.assertEqual(self.top(), [second.pk, first.pk, third.pk])
+		self.assertEqual(self.top(region=self.city.pk), [first.pk])
+
+		third.regions.add(self.city)
+		second.main_region = self.city
+		second.save()
+		self.assert_consistent()
+		self.assertEqual(self.top(region=self.city.pk), [second.pk, first.pk, third.pk])
+		self.assertEqual(self.top(region=self.other_city.pk), [])
+
+		first.categories.remove(self.category)
+		self.city.regions_users.clear()
+		self.assert_consistent()
+		self.assertEqual(self.top(region=self.city.pk), [second.pk])
+		self.assertEqual(self.top(limit=1), [second.pk])
+
+	def test_top_queries(self):
+		with self.assertNumQueries(2):
+			self.assertEqual(len(self.top(fields='id,name')), 3)
+		self.assertEqual(self.client.get(reverse('user-top')).status_code, 400)
+		for limit in ['-1', '0', 'x']:
+			response = self.client.get(reverse('user-top'), {'category': self.category.pk, 'limit': limit})
+			self.assertEqual(response.status_code, 400, limit)
+
+
+class OutsourcerIndexTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.design = Category.objects.create(name='Визуализация', group_id=Group.OUTSOURCER.value)
+		self.furniture = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value)
+		self.city = Region.objects.create(name='City', country=None, place_id=1, osm_id=1)
+		self.other_city = Region.objects.create(name='Other City', country=None, place_id=2, osm_id=2)
+		self.owner = User.objects.create(name='Designer', main_region=self.city)
+		self.owner.categories.add(self.design)
+		self.local, self.best, self.remote = [
+			self.create_user(name, region, rating, self.design)
+			for name, region, rating in [('Local', self.city, 3), ('Best', self.other_city, 5), ('Remote', None, 4)]
+		]
+		self.supplier = self.create_user('Supplier', self.city, 10, self.furniture)
+		self.order = Order.objects.create(owner=self.owner, title='Visualization')
+		self.order.categories.add(self.design)
+		outsourcer_index.clear()
+
+	def create_user(self, name, region, rating, category):
+		user = User.objects.create(name=name, main_region=region, total_rating=rating)
+		user.categories.add(category)
+		return user
+
+	def candidates(self, **params):
+		response = self.client.get(reverse('order-candidates', args=[self.order.pk]), params)
+		return [(item['user_id'], item['in_region']) for item in response.json()]
+
+	def assert_consistent(self):
+		index = OutsourcerIndex()
+		index.build()
+		self.assertEqual(outsourcer_index._rankings, index._rankings)
+
+	def test_candidates(self):
+		self.assertEqual(
+			self.candidates(), [(self.local.pk, True), (self.best.pk, False), (self.remote.pk, False)]
+		)
+		self.assertEqual(self.candidates(limit=2), [(self.local.pk, True), (self.best.pk, False)])
+		with self.assertNumQueries(2):
+			self.candidates()
+		self.assertEqual(self.client.get(reverse('order-candidates', args=[0])).status_code, 404)
+
+	def test_invalid_limit(self):
+		url = reverse('order-candidates', args=[self.order.pk])
+		for limit in ['0', '-1', 'abc']:
+			self.assertEqual(self.client.get(url, {'limit': limit}).status_code, 400, limit)
+		self.assertEqual(len(self.client.get(url, {'limit': 1000}).json()), 3)
+
+	def test_incremental_refresh(self):
+		self.candidates()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.remote.main_region = self.city
+			self.remote.save()
+			self.best.total_rating = 2
+			self.best.save(update_fields=['total_rating'])
+			self.local.categories.remove(self.design)
+		self.assert_consistent()
+		with self.assertNumQueries(2):
+			self.assertEqual(self.candidates(), [(self.remote.pk, True), (self.best.pk, False)])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.remote.delete()
+		self.assert_consistent()
+		self.assertEqual(self.candidates(), [(self.best.pk, False)])
+
+	def test_other_process_replays_changes(self):
+		other = OutsourcerIndex()
+		other.build()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.best.categories.clear()
+		# другой процесс перечитывает только пользователей из журнала изменений
+		with mock.patch.object(other, 'build', side_effect=AssertionError('full rebuild')), self.assertNumQueries(1):
+			self.assertEqual(
+				[candidate.user_id for candidate in other.get_candidates([self.design.pk], self.city.pk)],
+				[self.local.pk, self.owner.pk, self.remote.pk]
+			)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.remote.categories.clear()
+		cache.delete(OutsourcerIndex.CHANGELOG_KEY.format(cache.get(OutsourcerIndex.VERSION_KEY)))
+		with mock.patch.object(other, 'build', wraps=other.build) as build:
+			self.assertEqual(
+				[candidate.user_id for candidate in other.get_candidates([self.design.pk], self.city.pk)],
+				[self.local.pk, self.owner.pk]
+			)
+		build.assert_called_once()
+
+	def test_profile_save_keeps_index_version(self):
+		self.candidates()
+		version = cache.get(OutsourcerIndex.VERSION_KEY)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.local.description = 'Новое описание'
+			self.local.save()
+		self.assertEqual(cache.get(OutsourcerIndex.VERSION_KEY), version)
+
+	def test_refresh_removes_rows_with_different_ratings(self):
+		UserRanking.objects.filter(user=self.local, region=None).update(total_rating=9)
+		outsourcer_index.build()
+		with self.captureOnCommitCallbacks(execute=True):
+			UserRanking.refresh_ratings([self.local.pk])
+		self.assert_consistent()
+
+	def test_benchmark_matches_orm(self):
+		out = StringIO()
+		call_command('benchmark_candidates', self.order.pk, repeat=2, stdout=out)
+		self.assertIn('Списки кандидатов совпадают', out.getvalue())
+
+
+class EventRefreshTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.designers = UserGroup.objects.create(code=Group.DESIGNER.value)
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		today = datetime.date.today()
+		self.current = Event.objects.create(type=1, title='Current', start_date=today, end_date=today)
+		self.current.group.add(self.designers)
+		yesterday = today - datetime.timedelta(days=1)
+		self.past = Event.objects.create(type=1, title='Past', start_date=yesterday, end_date=yesterday)
+		self.past.group.add(self.designers)
+
+	def refresh(self, **options):
+		call_command('refresh_events', stdout=StringIO(), **options)
+
+	@mock.patch('api.parser.get_session', side_effect=AssertionError('external request'))
+	def test_list_is_pure_read(self, get_session):
+		EventRefresh.objects.all().delete()
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('event-list'), {'events_type': 1, 'group': 0})
+		self.assertIn(self.current.pk, [event['id'] for event in response.json()])
+		self.assertEqual(self.client.get(reverse('event-list')).status_code, 400)
+		get_session.assert_not_called()
+
+	@mock.patch('api.parser.load_events', return_value=[])
+	def test_scheduler_refreshes_months(self, load_events):
+		self.refresh(months=2)
+		# schema-1: группа 0, schema-2: группы 0 и 1, по два месяца
+		self.assertEqual(load_events.call_count, 6)
+		self.assertEqual(EventRefresh.objects.count(), 6)
+		self.assertFalse(Event.objects.filter(pk=self.past.pk).exists())
+		self.assertTrue(Event.objects.filter(pk=self.current.pk).exists())
+
+		self.refresh(months=2)
+		self.assertEqual(load_events.call_count, 6)
+		self.refresh(months=2, force=True)
+		self.assertEqual(load_events.call_count, 12)
+
+	@mock.patch('api.parser.load_events', return_value=[])
+	def test_default_months_cover_list_range(self, load_events):
+		self.refresh()
+		start_date, end_date = get_date_range()
+		months = sorted(set(EventRefresh.objects.values_list('month', flat=True)))
+		self.assertEqual(months[0], start_date)
+		self.assertEqual(months[-1], end_date.replace(day=1))
+		self.assertEqual(len(months), len({(day.year, day.month) for day in (
+			start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)
+		)}))
+
+	@mock.patch('api.parser.load_events', side_effect=[None, ConnectionError('timeout'), [], [], [], []])
+	def test_failed_sources_retried(self, load_events):
+		self.refresh(months=2)
+		self.assertEqual(EventRefresh.objects.count(), 4)
+		load_events.side_effect = None
+		load_events.return_value = []
+		self.refresh(months=2)
+		self.assertEqual(load_events.call_count, 8)
+		self.assertEqual(EventRefresh.objects.count(), 6)
+
+
+class EventSourceHandler(BaseHTTPRequestHandler):
+	# Локальная замена сайта с событиями: страницы /events/<n>, /flaky (сначала 503), /slow и 404 для остального
+	lock = threading.Lock()
+	hits = {}
+	active = 0
+	max_active = 0
+
+	def do_GET(self):
+		with self.lock:
+			self.hits[self.path] = self.hits.get(self.path, 0) + 1
+			hits = self.hits[self.path]
+			EventSourceHandler.active += 1
+			EventSourceHandler.max_active = max(self.max_active, self.active)
+		try:
+			time.sleep(0.05)
+			if self.path == '/slow':
+				time.sleep(0.5)
+				self.respond(200, 'late')
+			elif self.path.startswith('/events/'):
+				number = self.path.rsplit('/', 1)[1]
+				self.respond(200, (
+					f'<div class="feed"><article><a class="title" href="/e/{number}">Event {number}</a>'
+					f'<span class="date">01.10.2026 - 02.10.2026</span></article></div>'
+				))
+			elif self.path == '/flaky':
+				self.respond(503 if hits == 1 else 200, 'ok')
+			else:
+				self.respond(404, 'not found')
+		finally:
+			with self.lock:
+				EventSourceHandler.active -= 1
+
+	def respond(self, code, body):
+		body = body.encode()
+		self.send_response(code)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		try:
+			self.end_headers()
+			self.wfile.write(body)
+		except (BrokenPipeError, ConnectionResetError):
+			# клиент уже закрыл соединение по таймауту
+			pass
+
+	def log_message(self, *args):
+		pass
+
+
+class ParserFetchTestCase(TestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EventSourceHandler)
+		cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+		super().tearDownClass()
+
+	def setUp(self):
+		EventSourceHandler.hits = {}
+		EventSourceHandler.max_active = 0
+		# новая сессия без пауз между повторами
+		patcher = mock.patch.multiple('api.parser', _session=None, FETCH_BACKOFF=0)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		UserGroup.objects.create(code=Group.DESIGNER.value)
+
+	def fetch(self, paths, **kwargs):
+		return dict(parser.fetch_all([self.base_url + path for path in paths], **kwargs))
+
+	def test_bounded_concurrency_and_pooling(self):
+		responses = self.fetch([f'/events/{i}' for i in range(8)], concurrency=3)
+		self.assertEqual({response.status_code for response in responses.values()}, {200})
+		self.assertLessEqual(EventSourceHandler.max_active, 3)
+		self.assertGreater(EventSourceHandler.max_active, 1)
+		self.assertIs(parser.get_session(), parser.get_session())
+
+	def test_retries_and_timeouts(self):
+		responses = self.fetch(['/flaky', '/slow'], timeout=(1, 0.2))
+		self.assertEqual(responses[self.base_url + '/flaky'].status_code, 200)
+		self.assertEqual(EventSourceHandler.hits['/flaky'], 2)
+		self.assertIsInstance(responses[self.base_url + '/slow'], requests.RequestException)
+
+	def test_load_events(self):
+		config = [{
+			'url': self.base_url,
+			'params': [
+				{
+					'group': Group.DESIGNER.value,
+					'query_pathname': path,
+					'date_from': {'value': None, 'is_query_param': True},
+					'date_to': {'value': None, 'is_query_param': True},
+				}
+				for path in ['/events/1', '/events/2']
+			],
+			'output': {
+				'root': '.feed',
+				'children': 'article',
+				'fields': [
+					{'field': 'title', 'selector': '.title'},
+					{'field': 'source_link', 'selector': '.title', 'attribute': 'href'},
+					{'field': 'start_date', 'selector': '.date'},
+				],
+			},
+		}]
+		with mock.patch('api.parser.load_schema', return_value=parser.EventsSchema.compile(config)):
+			events = parser.load_events(2, Group.DESIGNER.value)
+		self.assertEqual(sorted(event.title for event in events), ['Event 1', 'Event 2'])
+		self.assertEqual(
+			set(Event.objects.filter(group__code=Group.DESIGNER.value).values_list('source_link', flat=True)),
+			{f'{self.base_url}/e/1', f'{self.base_url}/e/2'}
+		)
+
+		config[0]['params'][1]['query_pathname'] = '/missing'
+		with mock.patch('api.parser.load_schema', return_value=parser.EventsSchema.compile(config)):
+			self.assertIsNone(parser.load_events(2, Group.DESIGNER.value))
+
+
+class EventsSchemaTestCase(SimpleTestCase):
+	config = '''
+- url: https://example.com
+  params:
+    - group: 0
+      query_pathname: /events
+      date_from:
+        value: "%d.%m.%Y"
+      date_to:
+        value: "%d.%m.%Y"
+  output:
+    root: .feed
+    children: article
+    fields:
+    - field: cover
+      selector: ""
+      attribute: src
+    - field: title
+      selector: h2
+    - field: start_date
+      selector: .date
+    - field: source_link
+      selector: h2 a
+      attribute: href
+'''
+
+	def setUp(self):
+		self.path = os.path.join(tempfile.mkdtemp(), 'schema-9.yml')
+		self.addCleanup(shutil.rmtree, os.path.dirname(self.path))
+		self.write(self.config, modified_at=1)
+
+	def write(self, config, modified_at):
+		with open(self.path, 'w') as file:
+			file.write(config)
+		os.utime(self.path, (modified_at, modified_at))
+
+	def test_schema_cached_until_file_changes(self):
+		schema = parser.load_schema(self.path)
+		self.assertIs(parser.load_schema(self.path), schema)
+		params = parser.get_params_for_group(schema.config, 0, '01.10.2026', '31.10.2026')
+		self.assertEqual(params[0]['date_to']['value'], '31.10.2026')
+		# параметры заполняются в копии, загруженная конфигурация не меняется
+		self.assertEqual(schema.config[0]['params'][0]['date_to']['value'], '%d.%m.%Y')
+
+		self.write(self.config.replace('root: .feed', 'root: .events'), modified_at=2)
+		changed = parser.load_schema(self.path)
+		self.assertIsNot(changed, schema)
+		self.assertEqual(changed.config[0]['output']['root'], '.events')
+
+		self.write(self.config.replace('selector: h2 a', 'selector: "h2 >"'), modified_at=3)
+		with self.assertRaises(parser.SchemaError):
+			parser.load_schema(self.path)
+
+	def test_compiled_fields(self):
+		output = parser.load_schema(self.path).outputs[0]
+		html = (
+			'<div class="feed">'
+			'<article><h2><a href="/e/1">Range</a></h2><span class="date">01.10.2026 - 03.10.2026</span></article>'
+			'<article><h2><a href="https://other.com/e/2">Single</a></h2><span class="date">05.10.2026</span></article>'
+			'</div><article><h2>Outside</h2></article>'
+		)
+		self.assertEqual(list(output.extract(BeautifulSoup(html, 'html.parser'))), [
+			{
+				'title': 'Range', 'source_link': 'https://example.com/e/1',
+				'start_date': datetime.datetime(2026, 10, 1), 'end_date': datetime.datetime(2026, 10, 3),
+			},
+			{'title': 'Single', 'source_link': 'https://other.com/e/2', 'start_date': datetime.datetime(2026, 10, 5)},
+		])
+
+
+	def test_strainer_limits_parsing_to_root(self):
+		self.assertIsNone(parser.build_strainer('.feed > div'))
+		output = parser.load_schema(self.path).outputs[0]
+		html = (
+			'<header><article><h2>Menu</h2></article></header>'
+			'<div class="wide feed"><article><h2><a href="/e/1">Event</a></h2></article></div>'
+		)
+		soup = output.parse(html, 'html.parser')
+		self.assertIsNone(soup.find('header'))
+		self.assertEqual(
+			list(output.extract(soup)), list(output.extract(output.parse(html, 'html.parser', strain=False)))
+		)
+
+	def test_benchmark(self):
+		page = os.path.join(os.path.dirname(self.path), 'page.html')
+		with open(page, 'w', encoding='utf-8') as file:
+			file.write('<nav>' + '<a href="#">menu</a>' * 200 + '</nav><div class="events-feed">' + ''.join(
+				f'<article class="search-item"><div class="item-content">'
+				f'<div class="item-content-title"><a href="/e/{i}">Event {i}</a></div>'
+				f'<div class="item-content-date">01.10.2026 - 03.10.2026</div></div></article>'
+				for i in range(20)
+			) + '</div>')
+		out = StringIO()
+		call_command('benchmark_event_parser', 2, page, repeat=1, stdout=out)
+		self.assertIn('html.parser + SoupStrainer', out.getvalue())
+		self.assertIn('событий 20', out.getvalue())
+		self.assertNotIn('отличается', out.getvalue())
+
+
+class EventPersistenceTestCase(TestCase):
+	def setUp(self):
+		self.designers = UserGroup.objects.create(code=Group.DESIGNER.value)
+		self.outsourcers = UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		self.schema = parser.CompiledSchema('https://example.com', {
+			'root': '.feed',
+			'children': 'article',
+			'fields': [
+				{'field': 'title', 'selector': 'a'},
+				{'field': 'source_link', 'selector': 'a', 'attribute': 'href'},
+				{'field': 'start_date', 'selector': '.date'},
+			],
+		})
+		self.known = Event.objects.create(
+			type=1, title='Known', source_link='https://example.com/e/0', start_date='2026-10-01', end_date='2026-10-01'
+		)
+		self.known.group.add(self.outsourcers)
+
+	def page(self, count):
+		# последнее событие повторяется на странице дважды
+		return '<div class="feed">' + ''.join(
+			f'<article><a href="/e/{i}">Event {i}</a><span class="date">01.10.2026 - 02.10.2026</span></article>'
+			for i in list(range(count)) + [count - 1]
+		) + '</div>'
+
+	def test_page_saved_in_constant_queries(self):
+		with CaptureQueriesContext(connection) as queries:
+			events = parser.parse_events(1, Group.DESIGNER.value, self.page(300), self.schema)
+		# SQLite делит вставку событий на пакеты из-за ограничения числа параметров запроса
+		self.assertEqual(len(queries), 5 if connection.features.max_query_params is None else 8)
+		self.assertEqual(len(events), 299)
+		self.assertTrue(all(event.pk for event in events))
+		self.assertEqual(Event.objects.count(), 300)
+		self.assertEqual(self.designers.events_for_groups.count(), 300)
+		self.assertEqual(set(self.known.group.all()), {self.designers, self.outsourcers})
+
+		with self.assertNumQueries(4):
+			self.assertEqual(parser.parse_events(1, Group.DESIGNER.value, self.page(300), self.schema), [])
+		self.assertEqual(Event.objects.count(), 300)
+
+	def test_source_link_unique(self):
+		Event.objects.create(type=1, title='No link', start_date='2026-10-01', end_date='2026-10-01')
+		Event.objects.create(type=1, title='No link', start_date='2026-10-01', end_date='2026-10-01')
+		with self.assertRaises(IntegrityError), transaction.atomic():
+			Event.objects.create(
+				type=1, title='Copy', source_link=self.known.source_link, start_date='2026-10-01', end_date='2026-10-01'
+			)
+
+
+class UserSearchTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.furniture = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value, keywords='диваны кресла')
+		self.lighting = Category.objects.create(name='Освещение', group_id=Group.SUPPLIER.value)
+		self.sofa_maker = User.objects.create(name='Фабрика Уют', description='Производство мягкой мебели')
+		self.sofa_maker.categories.add(self.furniture)
+		self.lamp_maker = User.objects.create(name='Светлый дом', total_rating=4)
+		self.lamp_maker.categories.add(self.lighting)
+
+	def search(self, **params):
+		response = self.client.get(reverse('user-search'), params)
+		self.assertEqual(response.status_code, 200)
+		return [user['id'] for user in response.json()]
+
+	def test_search_by_category_keywords(self):
+		self.assertEqual(self.search(keywords='диваны'), [self.sofa_maker.pk])
+		self.assertEqual(self.search(keywords='Светлый'), [self.lamp_maker.pk])
+		self.assertEqual(self.search(keywords='Уют,Светлый', categories=self.lighting.pk), [self.lamp_maker.pk])
+
+	def test_search_follows_category_changes(self):
+		self.furniture.keywords = 'столы'
+		self.furniture.save()
+		self.assertEqual(self.search(keywords='столы'), [self.sofa_maker.pk])
+
+	def test_limit(self):
+		self.assertEqual(len(self.search(limit=1)), 1)
+		self.assertEqual(len(self.search(limit=1000)), 2)
+		for limit in ['x', '0', '-1']:
+			self.assertEqual(self.client.get(reverse('user-search'), {'limit': limit}).status_code, 400, limit)
+
+	def test_postgres_indexes(self):
+		with connection.cursor() as cursor:
+			existing = connection.introspection.get_constraints(cursor, User._meta.db_table)
+		self.assertEqual('user_search_vector_idx' in existing, connection.vendor == 'postgresql')
+		if connection.vendor != 'postgresql':
+			self.assertFalse(any(index.name in existing for index in User.POSTGRES_INDEXES))
+
+
+class UnaccentTestCase(TestCase):
+	def test_unaccent(self):
+		self.assertEqual(unaccent('Ёлка и Йогурт café'), 'Елка и Иогурт cafe')
+		self.assertEqual(unaccent(None), '')
+
+	def test_user_unaccented_fields(self):
+		user = User.objects.create(name='Объёмный дизайн', address='ул. Мира')
+		self.assertEqual(user.name_unaccented, 'Объемныи дизаин')
+		self.assertEqual(user.address_unaccented, 'ул. Мира')
+
+		user.name, user.address = 'Ёлка', 'ул. Йошкар-Олинская'
+		user.save(update_fields=['name', 'address'])
+		user.refresh_from_db()
+		self.assertEqual((user.name_unaccented, user.address_unaccented), ('Елка', 'ул. Иошкар-Олинская'))
+
+
 class PhoneRegexTestCase(TestCase):
 	def test_valid_phone_numbers(self):
 		valid_numbers = [
@@ -129,6 +1145,339 @@ class GroupTestCase(TestCase):
 		self.assertIn('Аутсорсеры', labels)
 		self.assertIn('Поставщики товаров', labels)
 
+	def test_group_label_by_value(self):
+		self.assertEqual(Group.get_label_by_value(Group.OUTSOURCER.value), 'Аутсорсеры')
+		with self.assertRaises(ValueError):
+			Group.get_label_by_value(5)
+
+
+class MetadataTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+
+	def test_rating_questions(self):
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('rating-questions'))
+		required, criteria = response.json()
+		self.assertEqual(list(required), ['deadlines', 'sales_service_quality'])
+		self.assertEqual(criteria['quality'], 'Качество продукции')
+		self.assertEqual(len(criteria), 6)
+
+		etag = response.headers['ETag']
+		self.assertIn('max-age', response.headers['Cache-Control'])
+		response = self.client.get(reverse('rating-questions'), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+	def test_user_field_names(self):
+		response = self.client.get(reverse('user-field-names'))
+		field_names = response.json()
+		self.assertEqual(field_names['name'], 'Название')
+		self.assertNotIn('token', field_names)
+		self.assertNotIn('groups_mask', field_names)
+
+
+class UserGroupsMaskTestCase(TestCase):
+	def setUp(self):
+		self.designers = UserGroup.objects.create(code=Group.DESIGNER.value)
+		self.outsourcers = UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		self.suppliers = UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.category = Category.objects.create(name='Дизайн интерьера', group=self.designers)
+		self.other_category = Category.objects.create(name='Мебель', group=self.suppliers)
+		self.user = User.objects.create(name='Test User')
+
+	def test_groups_follow_categories(self):
+		self.user.categories.add(self.category, self.other_category)
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.groups, [Group.DESIGNER.value, Group.SUPPLIER.value])
+
+		self.user.categories.remove(self.category)
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.groups, [Group.SUPPLIER.value])
+
+		self.other_category.users.clear()
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.groups, [])
+
+	def test_groups_follow_category_group(self):
+		self.user.categories.add(self.category)
+		category = Category.objects.get(pk=self.category.pk)
+		category.group = self.outsourcers
+		category.save()
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.groups, [Group.OUTSOURCER.value])
+		self.assertTrue(Outsourcer.objects.filter(pk=self.user.pk).exists())
+		self.assertFalse(Designer.objects.filter(pk=self.user.pk).exists())
+
+	def test_save_keeps_groups(self):
+		stale_user = User.objects.get(pk=self.user.pk)
+		self.user.categories.add(self.category)
+		stale_user.save()
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.groups, [Group.DESIGNER.value])
+
+	def test_list_serializer_without_queries(self):
+		self.user.categories.add(self.category)
+		users = list(User.objects.all())
+		with self.assertNumQueries(0):
+			data = UserListSerializer(users, many=True).data
+		self.assertEqual(data[0]['groups'], [Group.DESIGNER.value])
+
+
+class UserStatsTestCase(TestCase):
+	def setUp(self):
+		self.owner = User.objects.create(name='Designer')
+		self.executor = User.objects.create(name='Outsourcer')
+
+	def assertStatsConsistent(self, user):
+		user = User.objects.select_related('stats').get(pk=user.pk)
+		counters = [getattr(user, field) for field in UserStats.COUNTER_FIELDS]
+		rebuilt = UserStats.rebuild([user.pk])[0]
+		self.assertEqual(counters, [getattr(rebuilt, field) for field in UserStats.COUNTER_FIELDS])
+		return counters
+
+	def test_counters_follow_orders_and_ratings(self):
+		UserStats.rebuild()
+		order = Order.objects.create(owner=self.owner, title='Order', status=0)
+		order = Order.objects.get(pk=order.pk)
+		order.status = 1
+		order.save()
+		order.executor = self.executor
+		order.status = 3
+		order.save()
+		rating = Rating.objects.create(author=self.owner, receiver=self.executor, deadlines=5, sales_service_quality=4)
+
+		self.assertEqual(self.assertStatsConsistent(self.owner), [0, 1, 1, 0])
+		self.assertEqual(self.assertStatsConsistent(self.executor), [1, 0, 0, 1])
+
+		rating.delete()
+		Order.objects.get(pk=order.pk).delete()
+		self.assertEqual(self.assertStatsConsistent(self.owner), [0, 0, 0, 0])
+		self.assertEqual(self.assertStatsConsistent(self.executor), [0, 0, 0, 0])
+
+	def test_counters_single_read(self):
+		Order.objects.create(owner=self.owner, title='Order', status=4)
+		user = User.objects.select_related('stats').get(pk=self.owner.pk)
+		self.assertEqual(user.done_orders_count, 1)
+		user = User.objects.select_related('stats').get(pk=self.owner.pk)
+		with self.assertNumQueries(0):
+			self.assertEqual(user.placed_orders_count, 1)
+			self.assertEqual(user.voted_users_count, 0)
+
+
+class RatingSummaryTestCase(TestCase):
+	def setUp(self):
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		category = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value)
+		self.receiver = User.objects.create(name='Supplier')
+		self.receiver.categories.add(category)
+		self.authors = [User.objects.create(name=f'Designer {i}') for i in range(3)]
+
+	def rate(self, author, **values):
+		defaults = {'deadlines': 5, 'sales_service_quality': 5}
+		return Rating.objects.create(author=author, receiver=self.receiver, **{**defaults, **values})
+
+	def test_summary_matches_ratings(self):
+		RatingSummary.rebuild([self.receiver.pk])
+		self.rate(self.authors[0], quality=4, location=3)
+		rating = self.rate(self.authors[1], deadlines=3, quality=2)
+		self.rate(self.authors[2], sales_service_quality=1)
+
+		rating = Rating.objects.get(pk=rating.pk)
+		rating.quality = None
+		rating.location = 5
+		rating.save()
+		Rating.objects.filter(author=self.authors[2]).get().delete()
+
+		summary = RatingSummary.objects.get(pk=self.receiver.pk)
+		rebuilt = RatingSummary.rebuild([self.receiver.pk])[0]
+		for field in Rating.get_criteria():
+			self.assertEqual(getattr(summary, f'{field}_sum'), getattr(rebuilt, f'{field}_sum'))
+			self.assertEqual(getattr(summary, f'{field}_count'), getattr(rebuilt, f'{field}_count'))
+
+		averages = summary.get_averages(Rating.get_criteria())
+		self.assertEqual(averages['quality'], 4)
+		self.assertEqual(averages['deadlines'], 4)
+		self.assertEqual(averages['location'], 4)
+		self.assertIsNone(averages['service_delivery_quality'])
+
+	@override_settings(RATING_UPDATE_MODE='sync')
+	def test_sync_total_rating(self):
+		# все оценки выставляются одному и тому же экземпляру получателя
+		for author, value in zip(self.authors, [5, 1, 1]):
+			self.rate(author, deadlines=value, sales_service_quality=value)
+		self.assertEqual(self.receiver.total_rating, 2.3)
+		self.receiver.refresh_from_db()
+		self.assertEqual(self.receiver.total_rating, 2.3)
+
+	@override_settings(RATING_UPDATE_MODE='sync')
+	def test_profile_save_keeps_total_rating(self):
+		loaded = User.objects.get(pk=self.receiver.pk)
+		for author, value in zip(self.authors, [5, 1, 1]):
+			self.rate(author, deadlines=value, sales_service_quality=value)
+		loaded.description = 'Новое описание'
+		with CaptureQueriesContext(connection) as queries:
+			loaded.save()
+		self.assertFalse([
+			query for query in queries if 'api_ratingsummary' in query['sql'] or 'api_userranking' in query['sql']
+		])
+		loaded.refresh_from_db()
+		self.assertEqual(loaded.total_rating, 2.3)
+
+	@override_settings(RATING_UPDATE_MODE='deferred')
+	def test_deferred_total_rating(self):
+		with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+			with transaction.atomic():
+				for author, value in zip(self.authors, [5, 4, 3]):
+					self.rate(author, quality=value)
+
+		user_updates = [query for query in queries if query['sql'].startswith('UPDATE "api_user"')]
+		self.assertEqual(len(user_updates), 1)
+		self.receiver.refresh_from_db()
+		self.assertEqual(self.receiver.total_rating, 4.7)
+
+	@override_settings(RATING_UPDATE_MODE='deferred')
+	def test_schedule_inside_transaction(self):
+		# пересчет планируется до выхода из atomic, чтобы on_commit относился к транзакции сохранения
+		depth = len(connection.atomic_blocks)
+		depths = []
+		with mock.patch.object(
+			TotalRatingUpdater, 'schedule', side_effect=lambda user: depths.append(len(connection.atomic_blocks))
+		):
+			rating = self.rate(self.authors[0], quality=4)
+			rating.delete()
+		self.assertEqual(depths, [depth + 1, depth + 1])
+
+	def test_avg_ratings_without_scanning(self):
+		self.rate(self.authors[0], quality=4, service_delivery_quality=4, designer_program_quality=4, location=4)
+		user = User.objects.select_related('rating_summary').get(pk=self.receiver.pk)
+		with self.assertNumQueries(0):
+			self.assertEqual(user.calculate_total_rating(), 4.3)
+			self.assertEqual(user.calculate_avg_ratings()['deadlines'], 5)
+		self.assertEqual(user.total_rating, 4.3)
+		related = user.calculate_avg_ratings(author=self.authors[0].pk)
+		self.assertEqual(related['author_id'], self.authors[0].pk)
+		self.assertEqual(related['quality'], 4)
+
+
+class UpdateRatingTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.SUPPLIER.value)
+		self.category = Category.objects.create(name='Мебель', group_id=Group.SUPPLIER.value)
+		self.author = User.objects.create(name='Designer', user_id='100')
+		self.url = reverse('user-ratings-update', args=[self.author.user_id])
+
+	def create_receivers(self, count):
+		receivers = []
+		for i in range(count):
+			receiver = User.objects.create(name=f'Supplier {i}')
+			receiver.categories.add(self.category)
+			receivers.append(receiver)
+		UserStats.rebuild([receiver.pk for receiver in receivers])
+		RatingSummary.rebuild([receiver.pk for receiver in receivers])
+		return receivers
+
+	def post(self, receivers, **values):
+		data = [
+			{'receiver_id': receiver.pk, 'deadlines': 5, 'sales_service_quality': 4, **values} for receiver in receivers
+		]
+		return self.client.post(self.url, data, content_type='application/json')
+
+	def test_upsert_batch(self):
+		receivers = self.create_receivers(3)
+		Rating.objects.create(author=self.author, receiver=receivers[0], deadlines=1, sales_service_quality=1)
+
+		response = self.post(receivers, quality=3)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(
+			[item['related_total_rating'] for item in response.json()], [4.0, 4.0, 4.0]
+		)
+		self.assertEqual(Rating.objects.filter(author=self.author).count(), 3)
+
+		for receiver in receivers:
+			receiver.refresh_from_db()
+			self.assertEqual(receiver.total_rating, 4.0)
+			self.assertEqual(receiver.stats.voted_users_count, 1)
+			summary = receiver.rating_summary
+			rebuilt = RatingSummary.rebuild([receiver.pk])[0]
+			for field in Rating.get_criteria():
+				self.assertEqual(getattr(summary, f'{field}_sum'), getattr(rebuilt, f'{field}_sum'))
+				self.assertEqual(getattr(summary, f'{field}_count'), getattr(rebuilt, f'{field}_count'))
+
+	def test_constant_queries(self):
+		receivers = self.create_receivers(8)
+		with CaptureQueriesContext(connection) as few:
+			self.post(receivers[:2])
+		with CaptureQueriesContext(connection) as many:
+			self.post(receivers[2:])
+		self.assertEqual(len(few), len(many))
+
+	def test_invalid_batch(self):
+		receivers = self.create_receivers(2)
+		self.assertEqual(self.post(receivers, quality='high').status_code, 400)
+		response = self.client.post(
+			self.url, [{'receiver_id': receivers[0].pk, 'quality': 5}], content_type='application/json'
+		)
+		self.assertEqual(response.status_code, 400)
+		response = self.client.post(self.url, [{'receiver_id': 0, 'deadlines': 5}], content_type='application/json')
+		self.assertEqual(response.status_code, 400)
+		response = self.client.post(self.url, [{'receiver_id': 'x', 'deadlines': 5}], content_type='application/json')
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(Rating.objects.exists())
+
+	def test_string_receiver_ids(self):
+		receivers = self.create_receivers(2)
+		data = [{'receiver_id': str(receiver.pk), 'deadlines': 5, 'sales_service_quality': 4} for receiver in receivers]
+		response = self.client.post(self.url, data, content_type='application/json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([item['receiver_id'] for item in response.json()], [receiver.pk for receiver in receivers])
+
+	def test_concurrent_create_retried(self):
+		# оценка создана параллельным запросом после чтения существующих оценок
+		receivers = self.create_receivers(2)
+		Rating.objects.create(author=self.author, receiver=receivers[0], deadlines=1, sales_service_quality=1)
+		existing = Rating.get_existing(self.author.pk, [receivers[0].pk])
+		with mock.patch.object(Rating, 'get_existing', side_effect=[{}, existing]):
+			response = self.post(receivers)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(Rating.objects.filter(author=self.author).count(), 2)
+		self.assertEqual(Rating.objects.get(author=self.author, receiver=receivers[0]).deadlines, 5)
+		self.assertEqual(RatingSummary.objects.get(pk=receivers[0].pk).deadlines_count, 1)
+
+
+class RatingAuthorsTestCase(TestCase):
+	def setUp(self):
+		self.client = Client()
+		UserGroup.objects.create(code=Group.OUTSOURCER.value)
+		category = Category.objects.create(name='Ремонт', group_id=Group.OUTSOURCER.value)
+		self.receiver = User.objects.create(name='Outsourcer')
+		self.receiver.categories.add(category)
+		self.url = reverse('rating-authors', args=[self.receiver.pk])
+
+	def rate(self, count):
+		for i in range(count):
+			author = User.objects.create(name=f'Designer {i}')
+			Rating.objects.create(author=author, receiver=self.receiver, deadlines=5, sales_service_quality=4, quality=1)
+
+	def test_avg_rating_in_query(self):
+		self.rate(5)
+		rating = Rating.objects.select_related('receiver').get(author__name='Designer 0')
+		with self.assertNumQueries(2):
+			data = self.client.get(self.url).json()
+		self.assertEqual(len(data), 5)
+		self.assertTrue(all(item['avg_rating'] == rating.avg_rating == 4.5 for item in data))
+
+	def test_cursor_pages(self):
+		self.rate(5)
+		authors = []
+		cursor = ''
+		while cursor is not None:
+			response = self.client.get(self.url, {'cursor': cursor, 'limit': 2})
+			authors += [item['author_id'] for item in response.json()]
+			cursor = response.headers.get('next-cursor')
+		self.assertEqual(authors, list(Rating.objects.order_by('-modified_date', '-id').values_list('author_id', flat=True)))
+		self.assertEqual(self.client.get(self.url, {'cursor': 'invalid'}).status_code, 400)
+
 
 class UserTestCase(TestCase):
 	def setUp(self):
@@ -3,7 +3,9 @@ from django.urls import path
 from .views import (
 	RatingQuestionsView, CategoryList, CategoryDetail, UserList, UserDetail, UpdateRatingView, RegionList, RegionDetail,
 	UserFieldNamesView, FileUploadView, OrderListView, OrderDetail, RatingListView, FavouriteListView,
-	UpdateFavouriteView, SupportListView, SupportDetail, UserSearchView, MessageListCreateView, LogView, EventListView
+	UpdateFavouriteView, SupportListView, SupportDetail, UserSearchView, MessageListCreateView, LogView, EventListView,
+	UserTokenView, UserBatchView, UserTopView, OrderRespondView, OrderWithdrawView, OrderExecutorView,
+	OrderCandidatesView
 )
 
 urlpatterns = [
@@ -13,6 +15,9 @@ urlpatterns = [
 	path('categories/<int:pk>/', CategoryDetail.as_view(), name='category-detail'),
 	path('users/', UserList.as_view(), name='user-list'),
 	path('users/<int:pk>/', UserDetail.as_view(), name='user-detail'),
+	path('users/batch/', UserBatchView.as_view(), name='user-batch'),
+	path('users/top/', UserTopView.as_view(), name='user-top'),
+	path('users/<int:pk>/token/', UserTokenView.as_view(), name='user-token'),
 	path('users/check_duplicates/', UserDetail.as_view(), name='check-duplicates'),
 	path('users/create/', UserDetail.as_view(), name='user-create'),
 	path('users/<str:user_id>/update_ratings/', UpdateRatingView.as_view(), name='user-ratings-update'),
@@ -22,7 +27,11 @@ urlpatterns = [
 
 	path('orders/', OrderListView.as_view(), name='order-list'),
 	path('orders/<int:pk>/', OrderDetail.as_view(), name='order-detail'),
+	path('orders/<int:pk>/candidates/', OrderCandidatesView.as_view(), name='order-candidates'),
 	path('orders/create/', OrderDetail.as_view(), name='order-create'),
+	path('orders/respond/', OrderRespondView.as_view(), name='order-respond'),
+	path('orders/withdraw/', OrderWithdrawView.as_view(), name='order-withdraw'),
+	path('orders/select_executor/', OrderExecutorView.as_view(), name='order-select-executor'),
 
 	path('rating/<int:receiver_id>/authors/', RatingListView.as_view(), name='rating-authors'),
 	path('rating/questions/', RatingQuestionsView.as_view(), name='rating-questions'),
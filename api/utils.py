@@ -1,9 +1,17 @@
+import base64
+import binascii
 import json
+import math
+import operator
+import unicodedata
 from datetime import date, timedelta
+from functools import reduce
 from os import path
 from typing import Tuple, Optional
 
+from django.core.exceptions import ValidationError
 from django.core.files.storage import FileSystemStorage
+from django.db.models import F, Q
 
 
 class MediaFileStorage(FileSystemStorage):
@@ -20,6 +28,14 @@ def user_directory_path(instance, filename: str):
 	return f'{directory_path}/{filename}'
 
 
+def unaccent(value: Optional[str]) -> str:
+	""" Удаляет диакритические знаки аналогично функции unaccent в PostgreSQL (ё -> е, й -> и) """
+	if not value:
+		return ''
+	decomposed = unicodedata.normalize('NFKD', value)
+	return unicodedata.normalize('NFC', ''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
 def read_json_data(filename: str) -> Optional[list]:
 	filepath = path.join(path.dirname(path.dirname(path.abspath(__file__))), filename)
 	try:
@@ -55,3 +71,127 @@ def get_date_range(date_object: date = None) -> Tuple[date, date]:
 		end_date = date(today.year, today.month, 1) + timedelta(days=31) + timedelta(days=365)
 
 	return start_date, end_date
+
+
+def encode_cursor(values: tuple) -> str:
+	""" Кодирует позицию последней записи страницы в непрозрачный токен """
+	data = json.dumps(list(values), ensure_ascii=False, separators=(',', ':')).encode()
+	return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token: str, size: int) -> Optional[tuple]:
+	""" Декодирует токен позиции, возвращает None для некорректного значения """
+	try:
+		data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+		values = json.loads(data)
+	except (ValueError, binascii.Error):
+		return None
+
+	if not isinstance(values, list) or len(values) != size:
+		return None
+	return tuple(values)
+
+
+def parse_limit(value: Optional[str], default: int, maximum: int) -> int:
+	""" Размер страницы из параметра запроса, ValueError для нечисловых и неположительных значений """
+	if value is None or value == '':
+		return default
+	limit = int(value)
+	if limit < 1:
+		raise ValueError(f'Некорректный размер страницы: {value}')
+	return min(limit, maximum)
+
+
+class KeysetPagination:
+	"""
+	Постраничная выдача по ключу последней записи предыдущей страницы (keyset pagination).
+
+	ordering - поля модели в порядке сортировки, '-' означает убывание, последнее поле должно быть уникальным.
+	Значения в курсоре проверяются по типам полей, NULL в полях с null=True сортируются в конец.
+	"""
+
+	def __init__(self, *ordering: str, page_size: int = 20, max_page_size: int = 100):
+		self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+		self.page_size = page_size
+		self.max_page_size = max_page_size
+
+	def get_limit(self, value: Optional[str]) -> int:
+		return parse_limit(value, self.page_size, self.max_page_size)
+
+	def order(self, queryset):
+		ordering = []
+		for name, descending in self.fields:
+			if queryset.model._meta.get_field(name).null:
+				expression = F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+			else:
+				expression = f'-{name}' if descending else name
+			ordering.append(expression)
+		return queryset.order_by(*ordering)
+
+	def decode(self, model, token: str) -> tuple:
+		""" Значения ключа из токена, ValueError для некорректного курсора """
+		values = decode_cursor(token, len(self.fields))
+		if values is None:
+			raise ValueError('Некорректный курсор')
+
+		position = []
+		for (name, _), value in zip(self.fields, values):
+			field = model._meta.get_field(name)
+			if value is None:
+				if not field.null:
+					raise ValueError(f'Пустое значение поля {name}')
+				position.append(None)
+				continue
+
+			if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+				raise ValueError(f'Некорректное значение поля {name}')
+			try:
+				value = field.to_python(value)
+			except ValidationError:
+				raise ValueError(f'Некорректное значение поля {name}')
+			if value is None or isinstance(value, float) and not math.isfinite(value):
+				raise ValueError(f'Некорректное значение поля {name}')
+			position.append(value)
+		return tuple(position)
+
+	def encode(self, obj) -> str:
+		values = []
+		for name, _ in self.fields:
+			value = getattr(obj, obj._meta.get_field(name).attname)
+			values.append(value.isoformat() if isinstance(value, date) else value)
+		return encode_cursor(values)
+
+	def filter(self, queryset, position: tuple):
+		# (a, b, c) после (x, y, z): a > x, либо a = x и b > y, либо a = x, b = y и c > z (с учетом направления)
+		model = queryset.model
+		branches = []
+		equal = Q()
+		for (name, descending), value in zip(self.fields, position):
+			if value is None:
+				# после NULL в конце сортировки идут только строки с тем же NULL и большими следующими полями
+				equal &= Q(**{f'{name}__isnull': True})
+				continue
+
+			after = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+			if model._meta.get_field(name).null:
+				after |= Q(**{f'{name}__isnull': True})
+			branches.append(equal & after)
+			equal &= Q(**{name: value})
+
+		name, descending = self.fields[0]
+		if position[0] is not None and not model._meta.get_field(name).null:
+			# условие на первое поле позволяет базе использовать индекс для диапазона
+			queryset = queryset.filter(**{f'{name}__{"lte" if descending else "gte"}': position[0]})
+		return queryset.filter(reduce(operator.or_, branches)) if branches else queryset.none()
+
+	def paginate(self, queryset, cursor: Optional[str], limit: int) -> Tuple[list, Optional[str]]:
+		""" Записи страницы и курсор следующей страницы (None для последней) """
+		queryset = self.order(queryset)
+		if cursor:
+			queryset = self.filter(queryset, self.decode(queryset.model, cursor))
+
+		items = list(queryset[:limit + 1])
+		if len(items) <= limit:
+			return items, None
+		items = items[:limit]
+		return items, self.encode(items[-1])
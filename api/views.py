@@ -1,15 +1,20 @@
 import itertools
-from datetime import date, datetime
+import re
+from datetime import date, datetime, timedelta
 from functools import cached_property
+from typing import Optional
 
 import requests
-from django.contrib.postgres.lookups import Unaccent
-from django.contrib.postgres.search import TrigramSimilarity, TrigramDistance
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.core import exceptions
 from django.core.files.base import ContentFile
-from django.db import models
-from django.db.models import Q, F, Count, Field, Max, Value
+from django.db import models, connection, transaction
+from django.db.models import Q, F, Count, Exists, OuterRef, ExpressionWrapper, BooleanField, Value
+from django.http import HttpResponse, HttpResponseNotModified
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (
@@ -18,16 +23,76 @@ from rest_framework.generics import (
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.models import Category, User, Rating, Region, File, Order, Favourite, Support, Message, Log, Event
-from .utils import get_date_range
-from .parser import load_events
+from api.models import (
+	Group, Category, User, Rating, Region, File, Order, OrderTombstone, Favourite, Support, Message, Log, Event,
+	UserRanking
+)
+from .matching import outsourcer_index
+from .registry import registry
+from .utils import get_date_range, encode_cursor, decode_cursor, parse_limit, KeysetPagination
 from .serializers import (
-	CategorySerializer, UserListSerializer, RatingSerializer, RegionSerializer, UserDetailSerializer,
-	FileUploadSerializer, OrderSerializer, FavouriteSerializer, SupportSerializer, MessageSerializer, LogSerializer,
-	EventSerializer
+	CategorySerializer, UserListSerializer, UserShortSerializer, RatingSerializer, RatingValuesSerializer, RegionSerializer,
+	UserDetailSerializer, FileUploadSerializer, OrderSerializer, FavouriteSerializer, SupportSerializer, MessageSerializer,
+	LogSerializer, EventSerializer
 )
 
 
+class SparseFieldsViewMixin:
+	"""
+	Выборочный набор полей ответа через параметр запроса fields=name,phone.
+	Связанные таблицы присоединяются только для запрошенных полей.
+	"""
+	select_related_fields = {}  # поле ответа -> пути для select_related
+	prefetch_related_fields = {}  # поле ответа -> пути для prefetch_related
+	
+	@cached_property
+	def requested_fields(self) -> Optional[list]:
+		fields: str = self.request.query_params.get('fields', '')
+		fields_list = [field for field in fields.replace(' ', '').split(',') if field]
+		return fields_list or None
+	
+	def is_requested(self, field_name: str) -> bool:
+		return self.requested_fields is None or field_name in self.requested_fields
+	
+	def apply_related_fields(self, queryset):
+		select_related, prefetch_related = set(), set()
+		for field_name, lookups in self.select_related_fields.items():
+			if self.is_requested(field_name):
+				select_related.update(lookups)
+		for field_name, lookups in self.prefetch_related_fields.items():
+			if self.is_requested(field_name):
+				prefetch_related.update(lookups)
+		
+		if select_related:
+			queryset = queryset.select_related(*select_related)
+		if prefetch_related:
+			queryset = queryset.prefetch_related(*prefetch_related)
+		return queryset
+	
+	def get_serializer(self, *args, **kwargs):
+		kwargs.setdefault('fields', self.requested_fields)
+		return super().get_serializer(*args, **kwargs)
+
+
+class KeysetPageMixin:
+	""" Постраничная выдача по параметрам cursor и limit, курсор следующей страницы - в заголовке next-cursor """
+	keyset: KeysetPagination = None
+	
+	def get_cursor_page(self, queryset):
+		try:
+			limit = self.keyset.get_limit(self.request.query_params.get('limit'))
+		except ValueError:
+			return Response({'limit': 'Ожидается положительное число'}, status=status.HTTP_400_BAD_REQUEST)
+		try:
+			items, next_cursor = self.keyset.paginate(queryset, self.request.query_params.get('cursor'), limit)
+		except ValueError:
+			return Response({'cursor': 'Некорректное значение курсора'}, status=status.HTTP_400_BAD_REQUEST)
+		
+		headers = {'next-cursor': next_cursor} if next_cursor else {}
+		serializer = self.get_serializer(items, many=True)
+		return Response(serializer.data, headers=headers)
+
+
 class RegionList(ListAPIView):
 	queryset = Region.objects.all()
 	serializer_class = RegionSerializer
@@ -67,9 +132,25 @@ class CategoryDetail(RetrieveAPIView):
 	serializer_class = CategorySerializer
 
 
-class UserList(ListAPIView):
+class UserDetailFieldsMixin(SparseFieldsViewMixin):
+	select_related_fields = {
+		'main_region': ['main_region__country'],
+		'detail_rating': ['rating_summary'],
+		'voted_users_count': ['stats'],
+		'placed_orders_count': ['stats'],
+		'done_orders_count': ['stats'],
+		'executor_done_orders_count': ['stats'],
+	}
+	prefetch_related_fields = {
+		'categories': ['categories__group'],
+		'regions': ['regions__country'],
+	}
+
+
+class UserList(UserDetailFieldsMixin, KeysetPageMixin, ListAPIView):
 	queryset = User.objects.filter(access__gt=-1)
 	serializer_class = UserListSerializer
+	keyset = KeysetPagination('-total_rating', 'name', 'id')
 	
 	def get_queryset(self):
 		queryset = super().get_queryset()
@@ -81,13 +162,14 @@ class UserList(ListAPIView):
 		
 		if groups:
 			groups = list(map(int, groups))
-			queryset = queryset.filter(categories__group__in=groups)
+			queryset = queryset.in_groups(groups)
 		
-		return queryset.order_by('-total_rating', 'name')
+		return self.keyset.order(queryset)
 	
 	def get(self, request, *args, **kwargs):
 		offset = request.query_params.get('offset', 0)
 		limit = request.query_params.get('limit')
+		cursor = request.query_params.get('cursor')
 		id = request.query_params.get('id')
 		user_id = request.query_params.get('user_id')
 		is_rated = request.query_params.get('is_rated')
@@ -99,14 +181,14 @@ class UserList(ListAPIView):
 		
 		if params:
 			try:
-				user = User.objects.get(**params)
+				user = self.apply_related_fields(User.objects.all()).get(**params)
 				if is_rated:
 					if Rating.objects.filter(author=user).exists():
 						user.is_rated = True
 					else:
 						user.is_rated = False
 				
-				serializer = UserDetailSerializer(user)
+				serializer = UserDetailSerializer(user, fields=self.requested_fields)
 				return Response(serializer.data)
 			
 			except User.DoesNotExist:
@@ -115,9 +197,14 @@ class UserList(ListAPIView):
 		else:
 			queryset = self.get_queryset()
 			
+			if cursor is not None:
+				return self.get_cursor_page(queryset)
+			
 			if limit:
-				offset = int(offset)
-				limit = int(limit)
+				try:
+					offset, limit = int(offset), int(limit)
+				except ValueError:
+					return Response({'limit': 'Ожидается число'}, status=status.HTTP_400_BAD_REQUEST)
 				queryset = queryset[offset:offset + limit]
 			
 			serializer = self.get_serializer(queryset, many=True)
@@ -129,9 +216,9 @@ class UserList(ListAPIView):
 		return context
 
 
-class UserDetail(APIView):
+class UserDetail(UserDetailFieldsMixin, APIView):
 
-	def get_user(self, pk):
+	def get_user(self, pk, queryset=None):
 		user_id = self.request.query_params.get('user_id', None)
 		
 		try:
@@ -139,7 +226,9 @@ class UserDetail(APIView):
 			if user_id is not None:
 				query.update({"user_id": user_id})
 			
-			return User.objects.get(**query)
+			if queryset is None:
+				queryset = User.objects.all()
+			return queryset.get(**query)
 		
 		except User.DoesNotExist:
 			return Response(status=status.HTTP_404_NOT_FOUND)
@@ -148,22 +237,15 @@ class UserDetail(APIView):
 			return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 	
 	def check_duplicates(self, data):
-		main_region = data.get('main_region')
-		cat_ids = data.get('categories')
-		users = User.objects.filter(main_region_id=main_region, categories__in=cat_ids)
-		if users:
-			name = data.get('name', '')
-			address = data.get('address')
-			similarity = Q(name_similarity__gt=0.7)
-			if address:
-				similarity &= Q(address_similarity__lte=0.5)
-			
-			users = users.annotate(
-				name_similarity=TrigramSimilarity(Unaccent('name'), name),
-				address_similarity=TrigramDistance(Unaccent('address'), address) if address else Value("")
-			).filter(similarity).order_by('-name_similarity', 'address_similarity')
+		with transaction.atomic():
+			User.set_similarity_threshold(User.DUPLICATE_NAME_SIMILARITY)
+			user = User.find_duplicates(
+				data.get('name', ''),
+				address=data.get('address'),
+				main_region=data.get('main_region'),
+				categories=data.get('categories'),
+			).first()
 		
-		user = users.first()
 		if user:
 			serializer = UserDetailSerializer(user)
 			return Response(serializer.data, status=status.HTTP_200_OK)
@@ -174,59 +256,38 @@ class UserDetail(APIView):
 	def get(self, request, pk=None):
 		related_user_id = request.query_params.get('related_user')
 		with_details = request.query_params.get('with_details')
-		fields: str = request.query_params.get('fields', '')
-		fields_list = fields.replace(' ', '').split(',')
+		fields_list = self.requested_fields
 		context = {}
 		
-		user = self.get_user(pk)
+		short_info = not fields_list and (not with_details or with_details.lower() == 'false')
+		user = self.get_user(pk, None if short_info else self.apply_related_fields(User.objects.all()))
 		if not isinstance(user, User):
 			return user
 		
 		token = user.get_token()
 		headers = {'token': token}
 		
-		if not fields_list and not with_details or (with_details and with_details.lower() == 'false'):
-			data = {
-				"id": user.id,
-				"user_id": user.user_id,
-				"name": user.name,
-				"contact_name": user.contact_name,
-				"username": user.username or "",
-				"access": user.access,
-				"segment": user.segment,
-				"categories": user.categories.values_list("id", flat=True),
-				"groups": user.categories.values_list('group', flat=True).distinct(),
-				"total_rating": user.total_rating
-			}
-			return Response(data, status=status.HTTP_200_OK, headers=headers)
+		if short_info:
+			serializer = UserShortSerializer(user)
+			return Response(serializer.data, status=status.HTTP_200_OK, headers=headers)
 		
 		if related_user_id:
 			try:
 				context['related_user'] = int(related_user_id)
 				# проверим Избранное для дизайнера и поставщика
-				Favourite.objects.get(designer=related_user_id, supplier=user)
-				user.in_favourite = True
+				if self.is_requested('in_favourite'):
+					Favourite.objects.get(designer=related_user_id, supplier=user)
+					user.in_favourite = True
 			
 			except (ValueError, Favourite.DoesNotExist):
 				user.in_favourite = False
 		
-		else:
-			try:
-				# добавим Избранное для пользователя, если оно есть
-				supplier = Favourite.objects.filter(designer=user)
-				context['favourites'] = FavouriteSerializer(supplier, many=True).data
-			except Favourite.DoesNotExist:
-				pass
-		
-		serializer = UserDetailSerializer(user, context=context)
-		
-		if fields_list:
-			data = {}
-			for field in fields_list:
-				if field in serializer.data:
-					data[field] = serializer.data[field]
-			return Response(data, status=status.HTTP_200_OK, headers=headers)
-			
+		elif self.is_requested('favourites'):
+			# добавим Избранное для пользователя, если оно есть
+			supplier = Favourite.objects.filter(designer=user).select_related('supplier')
+			context['favourites'] = FavouriteSerializer(supplier, many=True).data
+		
+		serializer = UserDetailSerializer(user, context=context, fields=fields_list)
 		return Response(serializer.data, status=status.HTTP_200_OK, headers=headers)
 	
 	def post(self, request, pk=None):
@@ -273,12 +334,94 @@ class UserDetail(APIView):
 		return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RatingListView(ListAPIView):
+class UserTopView(UserDetailFieldsMixin, APIView):
+	""" Лучшие пользователи категории во всех регионах или в выбранном регионе """
+	default_limit = 10
+	max_limit = 100
+	
+	def get(self, request):
+		try:
+			category = int(request.query_params['category'])
+			region = request.query_params.get('region')
+			region = int(region) if region else None
+			limit = parse_limit(request.query_params.get('limit'), self.default_limit, self.max_limit)
+		except (KeyError, ValueError):
+			return Response(
+				{'detail': 'Необходимо указать категорию (category), регион (region) и лимит (limit) числами'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+		
+		# порядок и лимит берутся из предрасчитанной таблицы, затем загружаются карточки пользователей
+		user_ids = UserRanking.get_top(category, region, limit)
+		users = self.apply_related_fields(User.objects.filter(pk__in=user_ids)).in_bulk()
+		serializer = UserListSerializer(
+			[users[pk] for pk in user_ids if pk in users], many=True, fields=self.requested_fields
+		)
+		return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class UserBatchView(UserDetailFieldsMixin, APIView):
+	""" Получение карточек группы пользователей по id и/или user_id за один запрос """
+	max_users = 100
+	
+	def get(self, request):
+		with_details = request.query_params.get('with_details')
+		try:
+			ids = [int(pk) for pk in request.query_params.getlist('id')]
+		except ValueError:
+			return Response({'id': 'Некорректное значение id'}, status=status.HTTP_400_BAD_REQUEST)
+		user_ids = request.query_params.getlist('user_id')
+		
+		if not ids and not user_ids:
+			return Response([], status=status.HTTP_200_OK)
+		
+		if len(ids) + len(user_ids) > self.max_users:
+			return Response(
+				{'detail': f'Не более {self.max_users} пользователей за запрос'}, status=status.HTTP_400_BAD_REQUEST
+			)
+		
+		queryset = User.objects.filter(Q(id__in=ids) | Q(user_id__in=user_ids))
+		if with_details and with_details.lower() != 'false':
+			users = list(self.apply_related_fields(queryset))
+			User.load_aggregates(users)
+			serializer = UserDetailSerializer(users, many=True, fields=self.requested_fields)
+		else:
+			serializer = UserShortSerializer(queryset.prefetch_related('categories'), many=True)
+		
+		return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class UserTokenView(APIView):
+	""" Явная выдача токена пользователю с расширенным доступом """
+	
+	def post(self, request, pk):
+		user = get_object_or_404(User, pk=pk)
+		if user.access <= 0:
+			return Response(status=status.HTTP_403_FORBIDDEN)
+		
+		token = user.get_token() or user.generate_token()
+		if token is None:
+			return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+		return Response({'token': token}, status=status.HTTP_200_OK, headers={'token': token})
+
+
+class RatingListView(KeysetPageMixin, ListAPIView):
 	serializer_class = RatingSerializer
+	keyset = KeysetPagination('-modified_date', '-id')
 	
 	def get_queryset(self):
 		receiver_id = self.kwargs['receiver_id']
-		return Rating.objects.filter(receiver_id=receiver_id)
+		# группа получателя определяется один раз, средняя оценка каждой строки считается в запросе
+		groups_mask = User.objects.filter(pk=receiver_id).values_list('groups_mask', flat=True).first() or 0
+		required = Group.OUTSOURCER.value in Group.from_mask(groups_mask)
+		return Rating.objects.filter(receiver_id=receiver_id).select_related('author').with_avg_rating(
+			required=required
+		).order_by('-modified_date', '-id')
+	
+	def list(self, request, *args, **kwargs):
+		if request.query_params.get('cursor') is None:
+			return super().list(request, *args, **kwargs)
+		return self.get_cursor_page(self.get_queryset())
 
 
 class UpdateRatingView(APIView):
@@ -292,35 +435,43 @@ class UpdateRatingView(APIView):
 		
 		author = get_object_or_404(User, user_id=user_id)
 		author_id = author.id
-		rating_data = []
+		values = {}
 		for rate in request.data:
-			receiver_id = rate.pop('receiver_id', None)
+			try:
+				receiver_id = int(rate.pop('receiver_id'))
+			except (KeyError, TypeError, ValueError, AttributeError):
+				return Response({'receiver_id': 'Ожидается число'}, status=status.HTTP_400_BAD_REQUEST)
 			# Если пользователь выставляет оценки самому себе, то вернем код 304
 			if receiver_id == author_id:
 				return Response(data=[], status=status.HTTP_304_NOT_MODIFIED)
 			
-			try:
-				# Если рейтинг для этого автора и получателя уже существует, то обновим его
-				rating = Rating.objects.get(author_id=author_id, receiver_id=receiver_id)
-				serializer = RatingSerializer(rating, data=rate, partial=True)
-			except Rating.DoesNotExist:
-				rate.update({'author': author_id, 'receiver': receiver_id})
-				serializer = RatingSerializer(data=rate, partial=True)
-			
+			serializer = RatingValuesSerializer(data=rate, partial=True)
 			try:
 				serializer.is_valid(raise_exception=True)
 			except ValidationError as e:
 				return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
-			rating = serializer.save()
-			
-			# Получим обновленный рейтинг и вернем его ответом
-			rating_data.append(
-				{
-					"receiver_id": receiver_id,
-					"author_id": author_id,
-					"related_total_rating": rating.avg_rating
-				}
+			values.setdefault(receiver_id, {}).update(serializer.validated_data)
+		
+		receivers = User.objects.in_bulk(values)
+		missing_receivers = [receiver_id for receiver_id in values if receiver_id not in receivers]
+		if missing_receivers:
+			return Response(
+				{'receiver': f'Недопустимый первичный ключ {missing_receivers}'}, status=status.HTTP_400_BAD_REQUEST
 			)
+		
+		# Все оценки пакета сохраняются в одной транзакции, получатели пересчитываются по одному разу
+		try:
+			ratings = Rating.upsert(author_id, values, receivers)
+		except exceptions.ValidationError as e:
+			return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+		
+		rating_data = [
+			{
+				"receiver_id": rating.receiver_id,
+				"author_id": author_id,
+				"related_total_rating": rating.avg_rating
+			} for rating in ratings
+		]
 		return Response(data=rating_data, status=status.HTTP_200_OK)
 
 
@@ -358,13 +509,24 @@ class UpdateFavouriteView(APIView):
 
 
 # Получение списка заказов
-class OrderListView(ListAPIView):
+class OrderListView(SparseFieldsViewMixin, ListAPIView):
 	serializer_class = OrderSerializer
 	queryset = Order.objects.all()
+	select_related_fields = {
+		'owner_id': ['owner'],
+		'owner_name': ['owner'],
+		'executor_id': ['executor'],
+		'executor_name': ['executor'],
+	}
+	prefetch_related_fields = {
+		'categories': ['categories__group'],
+		'responded_users': ['responded_users'],
+		'executor_name': ['responded_users'],
+	}
+	changes_page_size = 100
 	
-	@cached_property
-	def filtered_queryset(self):
-		queryset = super().get_queryset()
+	def get_filters(self) -> tuple:
+		# условия области выборки (категории, владелец, исполнитель) и состояния заказа (статус, актуальность)
 		cat_ids = self.request.query_params.getlist('categories')  # категории, в которых созданы заказы
 		owner_id = self.request.query_params.get('owner_id')  # id создателя заказов
 		executor_id = self.request.query_params.get('executor_id')  # id исполнителя заказов
@@ -374,35 +536,264 @@ class OrderListView(ListAPIView):
 		)  # статус заказа: 0 - снят, 1 - активный, 2 - завершен
 		actual_order = self.request.query_params.get('actual')  # флаг заказа с действующей датой или бессрочно
 		
-		q = Q()
+		# условия по связанным таблицам проверяются подзапросами EXISTS, поэтому строки заказов не размножаются
+		# и distinct не требуется
+		scope = Q()
 		if cat_ids:
-			# Присоединение категорий с к запросу
-			q &= Q(categories__id__in=cat_ids)
+			scope &= Exists(Order.categories.through.objects.filter(order_id=OuterRef('pk'), category_id__in=cat_ids))
 		
 		if owner_id:
-			q &= Q(owner_id=owner_id)
+			scope &= Q(owner_id=owner_id)
 		
 		if executor_id:
-			q &= Q(executor_id=executor_id)
+			scope &= Q(executor_id=executor_id)
+		
+		if exclude_owner_id:
+			scope &= ~Q(owner=exclude_owner_id)
 		
+		state = Q()
 		if order_status:
 			if isinstance(order_status, list):
-				q &= Q(status__in=order_status)
+				state &= Q(status__in=order_status)
 			else:
-				q &= Q(status=order_status)
+				state &= Q(status=order_status)
 		
 		if actual_order and actual_order.lower() != "false":
-			q &= (Q(executor__isnull=True) | Q(executor__in=F('responded_users'))) & (
+			executor_responded = Exists(
+				Order.responded_users.through.objects.filter(order_id=OuterRef('pk'), user_id=OuterRef('executor_id'))
+			)
+			# завершенные заказы не бывают актуальными, лента читает только незавершенные
+			state &= Q(status__in=Order.ACTIVE_STATUSES) & (Q(executor__isnull=True) | executor_responded) & (
 					Q(expire_date__gte=date.today()) | Q(expire_date__isnull=True)
 			)
 		
-		if exclude_owner_id:
-			q &= ~Q(owner=exclude_owner_id)
-		
-		return queryset.filter(q).order_by('-status', '-executor', 'expire_date')
+		return scope, state
+	
+	@cached_property
+	def filtered_queryset(self):
+		queryset = super().get_queryset()
+		scope, state = self.get_filters()
+		# сортировка по id исполнителя без присоединения таблицы пользователей, заказы без исполнителя в конце
+		return queryset.filter(scope & state).order_by(
+			'-status', F('executor_id').asc(nulls_last=True), 'expire_date', 'id'
+		)
 	
 	def get_queryset(self):
-		return self.filtered_queryset.distinct()
+		return self.apply_related_fields(self.filtered_queryset)
+	
+	@staticmethod
+	def decode_changes_cursor(token: str) -> Optional[tuple]:
+		# (modified_at, id, снимок), курсоры прежнего формата (modified_at, id) продолжают ленту изменений
+		position = decode_cursor(token, 3) or decode_cursor(token, 2)
+		if position is None:
+			return None
+		modified_at, pk, snapshot = (*position, False)[:3]
+		if not isinstance(modified_at, str) or type(pk) is not int or not isinstance(snapshot, bool):
+			return None
+		try:
+			modified_at = datetime.fromisoformat(modified_at)
+		except ValueError:
+			return None
+		if timezone.is_naive(modified_at):
+			modified_at = timezone.make_aware(modified_at)
+		return modified_at, pk, snapshot
+	
+	def get_changes(self, since: str, limit: int):
+		"""
+		Лента изменений заказов для синхронизации клиента, курсор следующего запроса всегда в заголовке next-cursor.
+		
+		Пустой since начинает первую загрузку: подходящие под фильтр заказы постранично по id, затем лента
+		продолжается изменениями после момента начала загрузки в порядке (modified_at, id). Изменившиеся заказы,
+		подходящие под фильтр, возвращаются целиком, удаленные и не подходящие под фильтр (в том числе по категориям,
+		владельцу и исполнителю) - отметками {"id": ..., "removed": true, "version": ...}.
+		Отметки о заказах, которых нет у клиента, пропускаются клиентом,
+		из двух записей одного заказа актуальна запись с большей версией.
+		Изменения отдаются только старше ORDER_CHANGES_SETTLE_SECONDS: дата изменения назначается при записи,
+		и транзакция, зафиксированная позже соседних, не должна оказаться позади курсора.
+		"""
+		horizon = timezone.now() - timedelta(seconds=settings.ORDER_CHANGES_SETTLE_SECONDS)
+		if since:
+			position = self.decode_changes_cursor(since)
+			if position is None:
+				return Response({'since': 'Некорректное значение курсора'}, status=status.HTTP_400_BAD_REQUEST)
+			modified_at, pk, snapshot = position
+		else:
+			modified_at, pk, snapshot = horizon, 0, True
+		
+		if modified_at < OrderTombstone.get_retention_start():
+			# отметки об удалениях после курсора могли быть удалены, клиенту нужна повторная загрузка
+			return Response(
+				{'since': 'Курсор устарел, загрузите заказы заново с пустым since'}, status=status.HTTP_410_GONE
+			)
+		
+		scope, state = self.get_filters()
+		if snapshot:
+			orders = Order.objects.filter(scope & state, id__gt=pk).order_by('id')
+			orders = list(self.apply_related_fields(orders)[:limit])
+			if len(orders) < limit:
+				# снимок загружен, дальше - изменения после начала загрузки
+				next_position = (modified_at, 0, False)
+			else:
+				next_position = (modified_at, orders[-1].id, True)
+			headers = {'next-cursor': encode_cursor((next_position[0].isoformat(), *next_position[1:]))}
+			return Response(self.get_serializer(orders, many=True).data, headers=headers)
+		
+		# изменения читаются по всем заказам: вышедшие из области выборки (другие категории, исполнитель)
+		# тоже должны получить отметку об удалении
+		orders = Order.objects.filter(modified_at__lte=horizon).filter(
+			Q(modified_at__gt=modified_at) | Q(modified_at=modified_at, id__gt=pk)
+		)
+		tombstones = OrderTombstone.objects.filter(modified_at__lte=horizon).filter(
+			Q(modified_at__gt=modified_at) | Q(modified_at=modified_at, order_id__gt=pk)
+		)
+		
+		condition = scope & state
+		is_visible = ExpressionWrapper(condition, output_field=BooleanField()) if condition else Value(True)
+		rows = orders.annotate(is_visible=is_visible).order_by('modified_at', 'id').values_list(
+			'modified_at', 'id', 'version', 'is_visible'
+		)
+		changes = sorted(
+			itertools.chain(
+				((row_modified_at, order_id, (version, visible)) for row_modified_at, order_id, version, visible in
+					rows[:limit]),
+				((tombstone_modified_at, order_id, None) for tombstone_modified_at, order_id in
+					tombstones.order_by('modified_at', 'order_id').values_list('modified_at', 'order_id')[:limit]),
+			),
+			key=lambda change: change[:2]
+		)[:limit]
+		
+		# полные данные загружаются только для заказов, оставшихся в выборке
+		visible_ids = [order_id for _, order_id, order in changes if order is not None and order[1]]
+		visible_orders = self.apply_related_fields(Order.objects.filter(pk__in=visible_ids)).in_bulk()
+		visible_orders = [visible_orders[order_id] for order_id in visible_ids if order_id in visible_orders]
+		serialized = dict(zip(
+			(order.id for order in visible_orders), self.get_serializer(visible_orders, many=True).data
+		))
+		data = []
+		for _, change_id, order in changes:
+			if change_id in serialized:
+				data.append(serialized[change_id])
+			elif order is not None:
+				data.append({'id': change_id, 'removed': True, 'version': order[0]})
+			else:
+				data.append({'id': change_id, 'removed': True})
+		
+		if changes:
+			modified_at, pk, _ = changes[-1]
+		return Response(data, headers={'next-cursor': encode_cursor((modified_at.isoformat(), pk, False))})
+	
+	def list(self, request, *args, **kwargs):
+		since = request.query_params.get('since')
+		if since is None:
+			return super().list(request, *args, **kwargs)
+		
+		try:
+			limit = parse_limit(request.query_params.get('limit'), self.changes_page_size, self.changes_page_size)
+		except ValueError:
+			return Response({'limit': 'Ожидается положительное число'}, status=status.HTTP_400_BAD_REQUEST)
+		return self.get_changes(since, limit)
+
+
+class OrderCommandView(APIView):
+	"""
+	Легкие команды над претендентами и исполнителем заказов без полной сериализации заказа.
+	Принимают пару {"order_id": ..., "user_id": ...} или список пар и возвращают компактное состояние заказов:
+	[{"id": ..., "version": ..., "executor": ..., "responded_users": [...]}]
+	Базовый класс без маршрута: подклассы задают operation - имя метода Order, принимающего список пар.
+	"""
+	operation = None
+	allow_empty_user = False
+	
+	def get_pairs(self, data) -> list:
+		items = data if isinstance(data, list) else [data]
+		pairs = []
+		for item in items:
+			try:
+				order_id = int(item['order_id'])
+				user_id = item.get('user_id')
+				if user_id is not None or not self.allow_empty_user:
+					user_id = int(user_id)
+			except (KeyError, TypeError, ValueError, AttributeError):
+				raise ValidationError('Ожидается {"order_id": int, "user_id": int} или их список')
+			pairs.append((order_id, user_id))
+		return pairs
+	
+	def get_orders(self, order_ids) -> models.QuerySet:
+		return Order.objects.filter(pk__in=order_ids)
+	
+	def post(self, request):
+		try:
+			pairs = self.get_pairs(request.data)
+		except ValidationError as e:
+			return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+		
+		order_ids = {order_id for order_id, _ in pairs}
+		user_ids = {user_id for _, user_id in pairs if user_id is not None}
+		missing_orders = order_ids - set(self.get_orders(order_ids).values_list('id', flat=True))
+		missing_users = user_ids - set(User.objects.filter(pk__in=user_ids).values_list('id', flat=True))
+		if missing_orders or missing_users:
+			return Response(
+				{'order_id': sorted(missing_orders), 'user_id': sorted(missing_users)},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+		
+		getattr(Order, self.operation)(pairs)
+		
+		responders = {}
+		through = Order.responded_users.through
+		for order_id, user_id in through.objects.filter(order_id__in=order_ids).values_list('order_id', 'user_id'):
+			responders.setdefault(order_id, []).append(user_id)
+		data = [
+			{'id': order_id, 'version': version, 'executor': executor_id, 'responded_users': responders.get(order_id, [])}
+			for order_id, version, executor_id in Order.objects.filter(pk__in=order_ids).order_by('id').values_list(
+				'id', 'version', 'executor_id'
+			)
+		]
+		return Response(data, status=status.HTTP_200_OK)
+
+
+class OrderRespondView(OrderCommandView):
+	""" Отклик пользователей на активные заказы """
+	
+	operation = 'add_responders'
+	
+	def get_orders(self, order_ids):
+		return super().get_orders(order_ids).filter(status=1)
+
+
+class OrderWithdrawView(OrderCommandView):
+	""" Отзыв откликов пользователей """
+	operation = 'remove_responders'
+
+
+class OrderExecutorView(OrderCommandView):
+	""" Выбор исполнителя заказа, user_id = null снимает исполнителя и удаляет его из списка претендентов """
+	operation = 'set_executors'
+	allow_empty_user = True
+
+
+class OrderCandidatesView(APIView):
+	"""
+	Кандидаты в исполнители заказа из индекса аутсорсеров в памяти: по категориям заказа,
+	сначала из основного региона заказчика, внутри - по убыванию общего рейтинга
+	"""
+	default_limit = 20
+	max_limit = 100
+	
+	def get(self, request, pk):
+		try:
+			limit = parse_limit(request.query_params.get('limit'), self.default_limit, self.max_limit)
+		except ValueError:
+			return Response({'limit': 'Ожидается положительное число'}, status=status.HTTP_400_BAD_REQUEST)
+		
+		order = Order.objects.filter(pk=pk).values_list('owner_id', 'owner__main_region_id').first()
+		if order is None:
+			return Response({'detail': 'Заказ не найден'}, status=status.HTTP_404_NOT_FOUND)
+		
+		owner_id, region_id = order
+		category_ids = list(Order.categories.through.objects.filter(order_id=pk).values_list('category_id', flat=True))
+		candidates = outsourcer_index.get_candidates(category_ids, region_id, limit=limit, exclude=[owner_id])
+		return Response([candidate._asdict() for candidate in candidates], status=status.HTTP_200_OK)
 
 
 # Обновление и удаление заказа
@@ -451,61 +842,31 @@ class OrderDetail(RetrieveUpdateDestroyAPIView):
 		return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class PrebuiltPayloadView(APIView):
+	""" Неизменяемый ответ, собранный один раз при запуске, с ETag по содержимому """
+	payload_name = None
+	cache_max_age = 60 * 60 * 24
+	
+	def get(self, request, *args, **kwargs):
+		payload = getattr(registry, self.payload_name)
+		if payload.etag in parse_etags(request.headers.get('If-None-Match', '')):
+			response = HttpResponseNotModified()
+		else:
+			response = HttpResponse(payload.body, content_type='application/json')
+		response['ETag'] = payload.etag
+		patch_cache_control(response, public=True, max_age=self.cache_max_age)
+		return response
+
+
 # Получение списка вопросов для выставления рейтинга
-class RatingQuestionsView(APIView):
-	def get(self, request):
-		try:
-			fields = Rating._meta.get_fields()
-		except exceptions:
-			return Response([])
-		
-		all_fields_dict = {}
-		required_fields_dict = {}
-		
-		for field in fields:
-			if isinstance(field, models.PositiveSmallIntegerField):
-				field_name = field.name
-				field_verbose_name = field.verbose_name
-				field_blank = field.blank
-				
-				all_fields_dict[field_name] = field_verbose_name
-				
-				if not field_blank:
-					required_fields_dict[field_name] = field_verbose_name
-		
-		return Response(
-			[
-				required_fields_dict,
-				all_fields_dict,
-			]
-		)
+class RatingQuestionsView(PrebuiltPayloadView):
+	""" Чтение вопросов рейтинга: [обязательные, все] """
+	payload_name = 'rating_questions'
 
 
-class UserFieldNamesView(APIView):
+class UserFieldNamesView(PrebuiltPayloadView):
 	""" Чтение названий полей модели User"""
-	
-	@classmethod
-	def get_fields(cls):
-		sortable_private_fields = [f for f in User._meta.private_fields if isinstance(f, Field)]
-		return sorted(
-			itertools.chain(User._meta.concrete_fields, sortable_private_fields, User._meta.many_to_many),
-			key=lambda f: f.creation_counter
-		)
-	
-	def get(self, request, *args, **kwargs):
-		fields = [
-			'name', 'contact_name', 'username', 'description', 'categories', 'main_region', 'regions',
-			'business_start_year', 'segment', 'address', 'phone', 'email', 'socials_url', 'site_url'
-		]
-		excludes = [
-			"id", "access", "user_id", "total_rating", "business_start_year", "created_date", "keywords", "token"
-		]
-		
-		field_names = {
-			field.name: field.verbose_name or field.name for field in self.get_fields()
-			if field.name not in excludes
-		}
-		return Response(field_names)
+	payload_name = 'user_field_names'
 
 
 class SupportListView(ListCreateAPIView):
@@ -590,6 +951,21 @@ class MessageListCreateView(APIView):
 
 
 class UserSearchView(APIView):
+	max_results = 100
+	
+	@staticmethod
+	def get_search_query(keywords_list: list) -> Optional[SearchQuery]:
+		# Каждая фраза - пересечение префиксов ее слов, фразы объединяются через ИЛИ
+		phrases = []
+		for keyword in keywords_list:
+			words = re.findall(r'\w+', keyword)
+			if words:
+				phrases.append(' & '.join(f'{word}:*' for word in words))
+		
+		if not phrases:
+			return None
+		return SearchQuery(' | '.join(f'({phrase})' for phrase in phrases), config=User.SEARCH_CONFIG, search_type='raw')
+	
 	def get(self, request):
 		query_params = request.query_params
 		
@@ -597,11 +973,15 @@ class UserSearchView(APIView):
 		total_rating = query_params.get('rating', None)
 		segment = query_params.get('segment', None)
 		keywords = query_params.get('keywords', None)
+		try:
+			limit = parse_limit(query_params.get('limit'), self.max_results, self.max_results)
+		except ValueError:
+			return Response({'limit': 'Ожидается положительное число'}, status=status.HTTP_400_BAD_REQUEST)
 		
 		_AND = Q()
 		
 		if categories:
-			_AND &= Q(categories__in=categories)
+			_AND &= Q(Exists(User.categories.through.objects.filter(user=OuterRef('pk'), category__in=categories)))
 		
 		if total_rating:
 			_AND &= Q(total_rating__gte=total_rating)
@@ -609,18 +989,30 @@ class UserSearchView(APIView):
 		if segment:
 			_AND &= Q(segment=segment)
 		
+		queryset = User.objects.filter(_AND)
+		
 		if keywords:
 			keywords_list = keywords.split(",")
-			_OR = Q()
-			for keyword in keywords_list:
-				_OR |= (Q(name__icontains=keyword) | Q(username__icontains=keyword)) | Q(keywords__icontains=keyword)
-				_OR |= Q(description__icontains=keyword) | Q(address__icontains=keyword)
-				_OR |= Q(categories__name__icontains=keyword) | Q(categories__keywords__icontains=keyword)
-				_OR |= Q(site_url__icontains=keyword)
-			_AND &= Q(_OR)
-		
-		queryset = User.objects.filter(_AND).distinct()
-		serializer = UserListSerializer(queryset, many=True)
+			if connection.vendor == 'postgresql':
+				search_query = self.get_search_query(keywords_list)
+				if search_query is None:
+					return Response([])
+				
+				queryset = queryset.filter(search_vector=search_query).annotate(
+					rank=SearchRank(F('search_vector'), search_query)
+				).order_by('-rank', '-total_rating')
+			
+			else:
+				# поиск по вхождению подстроки для СУБД без полнотекстового поиска (например, тестовой SQLite)
+				_OR = Q()
+				for keyword in keywords_list:
+					_OR |= (Q(name__icontains=keyword) | Q(username__icontains=keyword)) | Q(keywords__icontains=keyword)
+					_OR |= Q(description__icontains=keyword) | Q(address__icontains=keyword)
+					_OR |= Q(categories__name__icontains=keyword) | Q(categories__keywords__icontains=keyword)
+					_OR |= Q(site_url__icontains=keyword)
+				queryset = queryset.filter(_OR).distinct()
+		
+		serializer = UserListSerializer(queryset[:limit], many=True)
 		return Response(serializer.data)
 
 
@@ -643,33 +1035,35 @@ class LogView(APIView):
 		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class EventListView(APIView):
+class EventListView(SparseFieldsViewMixin, APIView):
+	prefetch_related_fields = {
+		'group': ['group'],
+	}
+	
 	def get(self, request, **kwargs):
 		group = request.query_params.get('group', None)
 		month = request.query_params.get('month')
 		year = request.query_params.get('year')
-		events_type = int(request.query_params.get('events_type'))
-		now = datetime.now()
-		group_list = [int(group)] if group is not None else [0, 1]
-		
-		query = Q(type=events_type, group__code__in=group_list, excluded=False)
-		events = Event.objects.filter(query)
-		# Получаем дату последнего обновления событий
-		last_update = events.aggregate(Max('modified_at'))['modified_at__max']
-		# получаем диапазон поиска событий в таблице в зависимости от переданных параметров запроса
-		start_date, end_date = get_date_range(datetime.strptime(month + "." + year, "%m.%Y") if month else None)
-		
-		# Если в дате последнего обновления сменился месяц, то выполним загрузку событий и удалим прошедшие события
-		if not events or events and last_update and last_update.month != now.month:
-			# Удаляем прошедшие события из базы данных
-			events.filter(end_date__month__lt=now.month).delete()
-			
-			# Парсим и загружаем новые события в своей категории для группы в БД
-			load_events(events_type, int(group), start_date, end_date)
+		try:
+			events_type = int(request.query_params['events_type'])
+			group_list = [int(group)] if group is not None else [0, 1]
+			# получаем диапазон поиска событий в таблице в зависимости от переданных параметров запроса
+			start_date, end_date = get_date_range(datetime.strptime(month + "." + year, "%m.%Y") if month else None)
+		except (KeyError, TypeError, ValueError):
+			return Response(
+				{'detail': (
+					'Необходимо указать тип событий (events_type) числом, необязательные группа (group), '
+					'месяц (month) и год (year) также указываются числами, месяц - вместе с годом'
+				)},
+				status=status.HTTP_400_BAD_REQUEST
+			)
 		
-		query &= Q(start_date__gte=start_date, start_date__lte=end_date)
-		# Получаем события для группы
-		events = Event.objects.filter(query)
+		# события загружаются заранее командой refresh_events, здесь только чтение по индексу (type, start_date)
+		in_groups = Event.group.through.objects.filter(event_id=OuterRef('pk'), usergroup__code__in=group_list)
+		events = Event.objects.filter(
+			Exists(in_groups), type=events_type, excluded=False, start_date__gte=start_date, start_date__lte=end_date
+		)
+		events = self.apply_related_fields(events)
 		
-		serializer = EventSerializer(events, many=True)
+		serializer = EventSerializer(events, many=True, fields=self.requested_fields)
 		return Response(serializer.data)
@@ -19,6 +19,19 @@ if API_SERVER:
 if BOT_SERVER:
     CORS_ALLOWED_ORIGINS = [BOT_SERVER]
 
+# Пересчет общего рейтинга после оценки: sync - сразу, deferred - один раз при фиксации транзакции
+RATING_UPDATE_MODE = env('RATING_UPDATE_MODE', default='sync')
+
+# Разбор страниц с событиями: lxml или html.parser, по умолчанию lxml, если он установлен
+EVENTS_HTML_PARSER = env('EVENTS_HTML_PARSER', default=None)
+
+# Лента изменений заказов orders/?since=: изменения отдаются не раньше чем через столько секунд после записи.
+# Значение должно превышать время самой долгой транзакции записи заказа и расхождение часов серверов приложения,
+# иначе изменение, зафиксированное позже соседних, окажется позади курсора клиента
+ORDER_CHANGES_SETTLE_SECONDS = env.int('ORDER_CHANGES_SETTLE_SECONDS', default=5)
+# Срок хранения отметок об удаленных заказах (команда prune_order_tombstones), более старые курсоры получают 410
+ORDER_TOMBSTONE_DAYS = env.int('ORDER_TOMBSTONE_DAYS', default=30)
+
 CORS_URLS_REGEX = r'^/api/.*$'
 ALLOWED_HOSTS = env('ALLOWED_HOSTS', list, ["*"])
 INTERNAL_IPS = ALLOWED_HOSTS